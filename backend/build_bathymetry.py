@@ -0,0 +1,82 @@
+"""
+Offline builder for the /plan_avoid bathymetry rasters.
+
+Samples a local elevation grid onto the router's Grid for each requested step and writes
+int16 depths in metres (positive down, land <= 0) to data/bathymetry_<step>.npy, which
+main.py memory-maps at startup so every worker shares one page-cached copy.
+
+Sources: a GEBCO/ETOPO-style netCDF (needs the optional netCDF4 package) or an .npz
+with `elevation`, `lat` and `lon` arrays (1-D, ascending).
+
+    python build_bathymetry.py GEBCO_2024.nc --steps 1,0.5,0.25,0.1
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from main import Grid, RASTER_DIR
+
+def open_source(path: Path):
+    """(elevation array-like indexed [lat, lon], lat, lon)."""
+    if path.suffix == ".npz":
+        data = np.load(path)
+        return data["elevation"], np.asarray(data["lat"]), np.asarray(data["lon"])
+    try:
+        from netCDF4 import Dataset
+    except ImportError:
+        raise SystemExit("netCDF sources need the netCDF4 package (pip install netCDF4)")
+    ds = Dataset(path)
+    def pick(*names):
+        for n in names:
+            if n in ds.variables:
+                return ds.variables[n]
+        raise SystemExit(f"{path}: none of {names} found")
+    elev = pick("elevation", "z", "Band1")
+    elev.set_auto_mask(False)
+    return elev, np.asarray(pick("lat", "latitude", "y")[:]), np.asarray(pick("lon", "longitude", "x")[:])
+
+def nearest_index(axis: np.ndarray, values: np.ndarray) -> np.ndarray:
+    i = np.clip(np.searchsorted(axis, values), 1, len(axis) - 1)
+    return np.where(np.abs(values - axis[i - 1]) <= np.abs(values - axis[i]), i - 1, i)
+
+def build_depth(elev, src_lat, src_lon, step: float, samples: int, agg: str, positive_down: bool) -> np.ndarray:
+    """
+    Depth raster for one grid step: each cell samples samples x samples nearest source
+    points and aggregates them (median by default; min is the conservative choice for
+    draft blocking).
+    """
+    grid = Grid(step)
+    offs = (np.arange(samples) - (samples - 1) / 2) / samples
+    lats = (grid.lats[:, None] + offs[None, :] * grid.step).reshape(-1)
+    lons = ((grid.lons[:, None] + offs[None, :] * grid.lon_step).reshape(-1) + 180.0) % 360.0 - 180.0
+    ri, ci = nearest_index(src_lat, lats), nearest_index(src_lon, lons)
+    # read each source row/column once, then fan out
+    ur, rinv = np.unique(ri, return_inverse=True)
+    uc, cinv = np.unique(ci, return_inverse=True)
+    block = np.asarray(elev[ur, uc] if not isinstance(elev, np.ndarray) else elev[np.ix_(ur, uc)], dtype=float)
+    depth = block[rinv][:, cinv] * (1.0 if positive_down else -1.0)
+    depth = depth.reshape(grid.nrows, samples, grid.ncols, samples)
+    depth = {"median": np.median, "min": np.min, "max": np.max}[agg](depth, axis=(1, 3))
+    return np.clip(np.rint(depth), -32768, 32767).astype(np.int16)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("source", type=Path, help="elevation grid (.nc or .npz)")
+    ap.add_argument("--steps", default="2,1,0.5,0.25,0.1", help="comma-separated grid steps (deg)")
+    ap.add_argument("--samples", type=int, default=3, help="sub-samples per cell side")
+    ap.add_argument("--agg", choices=("median", "min", "max"), default="median")
+    ap.add_argument("--positive-down", action="store_true", help="source already stores depth, not elevation")
+    ap.add_argument("--out", type=Path, default=RASTER_DIR)
+    args = ap.parse_args()
+
+    elev, src_lat, src_lon = open_source(args.source)
+    args.out.mkdir(parents=True, exist_ok=True)
+    for step in (float(s) for s in args.steps.split(",") if s.strip()):
+        depth = build_depth(elev, src_lat, src_lon, step, args.samples, args.agg, args.positive_down)
+        path = args.out / f"bathymetry_{step:g}.npy"
+        np.save(path, depth)
+        print(f"{path}: {depth.shape[0]}x{depth.shape[1]}, {np.mean(depth > 0):.1%} water")
+
+if __name__ == "__main__":
+    main()
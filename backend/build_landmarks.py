@@ -0,0 +1,56 @@
+"""
+Offline builder for the ALT heuristic tables used by /plan_avoid (heuristic="alt").
+
+For each grid step, picks ocean landmarks by farthest-point selection over the
+land-masked base graph (no hazards or weights) and stores the Dijkstra cost from every
+landmark to every cell as data/landmarks_<step>.npy, shaped (ncells, L) float32, which
+main.py memory-maps on first use. Rebuild after changing the land masks.
+
+    python build_landmarks.py --steps 1,0.5 --count 8
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from main import RASTER_DIR, get_grid, cell_costs, dijkstra_costs
+
+def build_table(step: float, count: int, seed_lat: float, seed_lon: float) -> np.ndarray:
+    grid = get_grid(step)
+    cost = cell_costs(grid, [], 0.0).data
+    seed = grid.row(seed_lat) * grid.ncols + grid.col(seed_lon)
+    # Farthest-point selection: each landmark is the reachable cell farthest from all
+    # landmarks picked so far (the first one is the cell farthest from the seed).
+    nearest = dijkstra_costs(grid, cost, seed)
+    columns = []
+    for _ in range(count):
+        reach = np.where(np.isfinite(nearest), nearest, -1.0)
+        lm = int(np.argmax(reach))
+        if reach[lm] <= 0:
+            break
+        dist = dijkstra_costs(grid, cost, lm)
+        columns.append(dist)
+        nearest = np.minimum(nearest, dist) if len(columns) > 1 else dist
+        r, c = divmod(lm, grid.ncols)
+        print(f"  landmark {len(columns)}: lat {grid.lats[r]:.2f} lon {grid.lons[c]:.2f}")
+    return np.stack(columns, axis=1)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--steps", default="2,1,0.5", help="comma-separated grid steps (deg)")
+    ap.add_argument("--count", type=int, default=8, help="landmarks per step")
+    ap.add_argument("--seed", default="0,-140", help="lat,lon inside the main ocean")
+    ap.add_argument("--out", type=Path, default=RASTER_DIR)
+    args = ap.parse_args()
+
+    seed_lat, seed_lon = (float(x) for x in args.seed.split(","))
+    args.out.mkdir(parents=True, exist_ok=True)
+    for step in (float(s) for s in args.steps.split(",") if s.strip()):
+        print(f"step {step:g}:")
+        table = build_table(step, args.count, seed_lat, seed_lon)
+        path = args.out / f"landmarks_{step:g}.npy"
+        np.save(path, table.astype(np.float32))
+        print(f"{path}: {table.shape[0]} cells x {table.shape[1]} landmarks")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Offline builder for the /plan_avoid navigability masks.
+
+Rasterizes a land-polygon GeoJSON (e.g. Natural Earth ne_10m_land.geojson; convert
+shapefiles with `ogr2ogr -f GeoJSON land.geojson ne_10m_land.shp`) onto the router's
+Grid for each requested step and writes bit-packed rows to
+data/landmask_<step>.npy, which main.py memory-maps at startup.
+
+    python build_landmask.py ne_10m_land.geojson --steps 2,1,0.5,0.25,0.1
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from main import Grid, RASTER_DIR
+
+def load_rings(path: Path) -> List[np.ndarray]:
+    """All polygon rings (exteriors and holes) as (k, 2) lon/lat arrays."""
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    feats = data.get("features", [data]) if isinstance(data, dict) else []
+    rings: List[np.ndarray] = []
+    for f in feats:
+        geom = f.get("geometry") or f
+        gtype = geom.get("type")
+        coords = geom.get("coordinates") or []
+        polys = [coords] if gtype == "Polygon" else coords if gtype == "MultiPolygon" else []
+        for poly in polys:
+            for ring in poly:
+                arr = np.asarray(ring, dtype=float)[:, :2]
+                if len(arr) >= 3:
+                    rings.append(arr)
+    return rings
+
+def rasterize_rings(rings: List[np.ndarray], lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Even-odd scanline fill: every edge emits its crossings with the sample latitudes,
+    and cells between consecutive crossings on a row are land. Holes fall out of the
+    even-odd rule. lats and lons must be ascending.
+    """
+    edges = np.concatenate([np.hstack([r, np.roll(r, -1, axis=0)]) for r in rings])
+    x0, y0, x1, y1 = edges.T
+    ylo, yhi = np.minimum(y0, y1), np.maximum(y0, y1)
+    i_lo = np.searchsorted(lats, ylo, side="left")
+    i_hi = np.searchsorted(lats, yhi, side="left")
+    count = i_hi - i_lo
+    edge = np.repeat(np.arange(len(edges)), count)
+    row = i_lo[edge] + (np.arange(edge.size) - np.repeat(np.cumsum(count) - count, count))
+    x = x0[edge] + (lats[row] - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+
+    order = np.lexsort((x, row))
+    row, x = row[order], x[order]
+    # crossings pair up as (enter, leave) within each row
+    first = np.r_[0, np.nonzero(np.diff(row))[0] + 1]
+    pos = np.arange(row.size) - np.repeat(first, np.diff(np.r_[first, row.size]))
+    a = np.nonzero(pos % 2 == 0)[0]
+    a = a[a + 1 < row.size]
+    a = a[row[a + 1] == row[a]]
+    b = a + 1
+
+    diff = np.zeros((len(lats), len(lons) + 1), dtype=np.int32)
+    np.add.at(diff, (row[a], np.searchsorted(lons, x[a])), 1)
+    np.add.at(diff, (row[b], np.searchsorted(lons, x[b])), -1)
+    return np.cumsum(diff, axis=1)[:, :-1] > 0
+
+def build_mask(rings: List[np.ndarray], step: float, samples: int) -> np.ndarray:
+    """
+    Land mask for one grid step. Each cell is sampled on a samples x samples lattice and
+    only counts as land when every sample is land, so narrow straits stay open.
+    """
+    grid = Grid(step)
+    offs = (np.arange(samples) - (samples - 1) / 2) / samples
+    lats = (grid.lats[:, None] + offs[None, :] * grid.step).reshape(-1)
+    lons = (grid.lons[:, None] + offs[None, :] * grid.lon_step).reshape(-1)
+    lons = (lons + 180.0) % 360.0 - 180.0
+    lon_order = np.argsort(lons, kind="stable")
+    fine = rasterize_rings(rings, lats, lons[lon_order])
+    fine = fine[:, np.argsort(lon_order)]
+    return fine.reshape(grid.nrows, samples, grid.ncols, samples).all(axis=(1, 3))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("land", type=Path, help="land polygons GeoJSON")
+    ap.add_argument("--steps", default="2,1,0.5,0.25,0.1", help="comma-separated grid steps (deg)")
+    ap.add_argument("--samples", type=int, default=3, help="sub-samples per cell side")
+    ap.add_argument("--out", type=Path, default=RASTER_DIR)
+    args = ap.parse_args()
+
+    rings = load_rings(args.land)
+    args.out.mkdir(parents=True, exist_ok=True)
+    for step in (float(s) for s in args.steps.split(",") if s.strip()):
+        mask = build_mask(rings, step, args.samples)
+        path = args.out / f"landmask_{step:g}.npy"
+        np.save(path, np.packbits(mask, axis=1))
+        print(f"{path}: {mask.shape[0]}x{mask.shape[1]}, {mask.mean():.1%} land")
+
+if __name__ == "__main__":
+    main()
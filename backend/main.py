@@ -1,18 +1,54 @@
 import os
-from typing import List, Tuple
-from math import radians, sin, cos, asin, atan2, sqrt
-from heapq import heappush, heappop
+import asyncio
+import gzip
+import hashlib
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional, Tuple
+from math import radians, degrees, sin, cos, asin, atan2, sqrt, ceil, floor, inf
+from heapq import heappush, heappop, heapify
+from functools import lru_cache, partial, wraps
+from time import monotonic, time
+from datetime import datetime, timezone
 
 import httpx
-from fastapi import FastAPI
+import numpy as np
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 import json
 from pathlib import Path
 
+try:
+    import brotli  # optional: adds a "br" variant to the feed endpoints
+except ImportError:
+    brotli = None
+
 # ---- FastAPI app ----
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_route_pool()
+    upstream_client()
+    await load_storms_from_disk()
+    storms_task = asyncio.create_task(refresh_storms_forever())
+    yield
+    storms_task.cancel()
+    await asyncio.gather(storms_task, return_exceptions=True)
+    await upstream_flights.cancel_all()  # a /storms request may still hold the "storms" fetch
+    await close_upstream_client()
+    stop_route_pool()
+    remove_feed_spool()
+
+app = FastAPI(lifespan=lifespan)
 
 # ---- CORS ----
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "")
@@ -41,23 +77,69 @@ def haversine_km(lat1, lon1, lat2, lon2):
     c = 2*asin(sqrt(a))
     return R_KM * c
 
-def interpolate_geodesic(lat1, lon1, lat2, lon2, n=128):
+def haversine_km_np(lat1, lon1, lat2, lon2):
+    """Same as haversine_km, but broadcasts over NumPy arrays."""
+    φ1, λ1, φ2, λ2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((φ2-φ1)/2)**2 + np.cos(φ1)*np.cos(φ2)*np.sin((λ2-λ1)/2)**2
+    return R_KM * 2*np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def initial_bearing_np(lat1, lon1, lat2, lon2):
+    """Initial great-circle bearing in degrees [0, 360), broadcasting over NumPy arrays."""
+    φ1, λ1, φ2, λ2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    y = np.sin(λ2-λ1) * np.cos(φ2)
+    x = np.cos(φ1)*np.sin(φ2) - np.sin(φ1)*np.cos(φ2)*np.cos(λ2-λ1)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+GEODESIC_MAX_SEG_NM = float(os.getenv("GEODESIC_MAX_SEG_NM", "60"))  # default spacing of emitted points
+
+def geodesic_points_np(lat1, lon1, lat2, lon2, f):
+    """
+    (lat, lon) degree arrays at fractions f along great circles; endpoints may be arrays
+    broadcasting against f (one leg per element).
+    """
+    φ1, λ1, φ2, λ2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    d = 2*np.arcsin(np.sqrt(np.sin((φ2-φ1)/2)**2 + np.cos(φ1)*np.cos(φ2)*np.sin((λ2-λ1)/2)**2))
+    sd = np.sin(d)
+    same = sd < 1e-12
+    sd = np.where(same, 1.0, sd)
+    A = np.where(same, 1 - f, np.sin((1 - f) * d) / sd)
+    B = np.where(same, f, np.sin(f * d) / sd)
+    x = A*np.cos(φ1)*np.cos(λ1) + B*np.cos(φ2)*np.cos(λ2)
+    y = A*np.cos(φ1)*np.sin(λ1) + B*np.cos(φ2)*np.sin(λ2)
+    z = A*np.sin(φ1) + B*np.sin(φ2)
+    return np.degrees(np.arctan2(z, np.hypot(x, y))), (np.degrees(np.arctan2(y, x)) + 540) % 360 - 180
+
+def interpolate_geodesic_batch(lat1, lon1, lat2, lon2, n=None, max_seg_nm=None) -> List[list]:
+    """
+    [lon, lat] point lists along many great-circle legs at once, endpoints included. Each
+    leg gets n segments, or as many as keep every segment under max_seg_nm (default
+    GEODESIC_MAX_SEG_NM); a zero-length leg is a single point.
+    """
+    lat1, lon1, lat2, lon2 = (np.atleast_1d(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    dist_nm = haversine_km_np(lat1, lon1, lat2, lon2) * KM_TO_NM
+    if n is not None:
+        segs = np.full(len(lat1), int(n))
+    else:
+        segs = np.maximum(1, np.ceil(dist_nm / (max_seg_nm or GEODESIC_MAX_SEG_NM))).astype(int)
+    segs[dist_nm == 0] = 0
+    sizes = segs + 1
+    leg = np.repeat(np.arange(len(lat1)), sizes)
+    first = np.cumsum(sizes) - sizes
+    f = (np.arange(sizes.sum()) - first[leg]) / np.maximum(segs, 1)[leg]
+    lat, lon = geodesic_points_np(lat1[leg], lon1[leg], lat2[leg], lon2[leg], f)
+    pts = np.column_stack([lon, lat]).tolist()
+    return [pts[i:i + k] for i, k in zip(first.tolist(), sizes.tolist())]
+
+def interpolate_geodesic(lat1, lon1, lat2, lon2, n=None, max_seg_nm=None):
+    """[lon, lat] points along one great circle; see interpolate_geodesic_batch."""
     φ1, λ1, φ2, λ2 = map(radians, [lat1, lon1, lat2, lon2])
     d = 2*asin(sqrt(sin((φ2-φ1)/2)**2 + cos(φ1)*cos(φ2)*sin((λ2-λ1)/2)**2))
     if d == 0:
-        return [(lon1, lat1)]
-    pts = []
-    for i in range(n + 1):
-        f = i / n
-        A = sin((1-f)*d) / sin(d)
-        B = sin(f*d) / sin(d)
-        x = A*cos(φ1)*cos(λ1) + B*cos(φ2)*cos(λ2)
-        y = A*cos(φ1)*sin(λ1) + B*cos(φ2)*sin(λ2)
-        z = A*sin(φ1) + B*sin(φ2)
-        φi = atan2(z, sqrt(x*x + y*y))
-        λi = atan2(y, x)
-        pts.append((((λi*180/3.141592653589793)+540)%360-180, φi*180/3.141592653589793))
-    return pts
+        return [[lon1, lat1]]
+    if n is None:
+        n = max(1, ceil(d * R_KM * KM_TO_NM / (max_seg_nm or GEODESIC_MAX_SEG_NM)))
+    lat, lon = geodesic_points_np(lat1, lon1, lat2, lon2, np.linspace(0.0, 1.0, n + 1))
+    return np.column_stack([lon, lat]).tolist()
 
 # ---- Models ----
 class Waypoint(BaseModel):
@@ -73,16 +155,43 @@ class HazardCircle(BaseModel):
     lon: float
     radius_nm: float
 
-class AvoidRequest(BaseModel):
-    origin: Waypoint
-    destination: Waypoint
+# Searches hold flat per-cell state for the whole grid (float32 cost and g, int8 parent,
+# closed flags: ~10-20 bytes a cell), so the finest step bounds memory per request:
+# 0.05 deg is ~26M cells, a few hundred MB.
+GRID_STEP_MIN_DEG = float(os.getenv("GRID_STEP_MIN_DEG", "0.05"))
+GRID_STEP_MAX_DEG = 10.0
+
+class CostSettings(BaseModel):
+    """What goes into the grid's cost field."""
     hazards: List[HazardCircle] = []
-    grid_step_deg: float = 1.0
+    grid_step_deg: float = Field(1.0, ge=GRID_STEP_MIN_DEG, le=GRID_STEP_MAX_DEG)
     penalty_nm: float = 200.0
-    max_nodes: int = 200000
     piracy_weight: float = 0.0
     storm_weight: float = 0.0
-    depth_penalty_nm: float = 0.0
+    depth_penalty_nm: float = 0.0  # added to cells shallower than SHALLOW_DEPTH_M
+    draft_m: float = 0.0  # cells shallower than this are never entered
+
+class AvoidSettings(CostSettings):
+    max_nodes: int = 200000
+    algo: Literal["astar", "bidirectional", "anytime", "visibility"] = "astar"  # visibility: hazards are no-go
+    hierarchical: bool = False
+    coarse_step_deg: Optional[float] = Field(None, ge=GRID_STEP_MIN_DEG, le=GRID_STEP_MAX_DEG)  # default: max(1.0, 4 * grid_step_deg)
+    corridor_deg: float = Field(2.0, ge=0.0)
+    heuristic: Literal["haversine", "alt"] = "haversine"
+    deadline_ms: Optional[int] = None  # wall-clock budget; "anytime" returns its best path when it expires
+    any_angle: bool = False  # string-pull the grid path into straight great-circle legs
+
+class AvoidRequest(AvoidSettings):
+    origin: Waypoint
+    destination: Waypoint
+
+class AvoidBatchRequest(AvoidSettings):
+    pairs: List[PlanRequest]  # every pair shares the hazards and settings
+
+class MatrixRequest(CostSettings):
+    origins: List[Waypoint]
+    destinations: Optional[List[Waypoint]] = None  # default: the origins (square matrix)
+    max_nodes: Optional[int] = Field(None, ge=1)  # settled cells per origin; default: until every destination is settled
 
 # ---- Health ----
 @app.get("/health")
@@ -92,11 +201,15 @@ def health():
 # ---- Great-circle plan ----
 @app.post("/plan")
 def plan(req: PlanRequest):
+    key = route_cache_key("plan", req)
+    hit = route_cache.get(key)
+    if hit is not None:
+        return route_response(hit)
     o = req.origin
     d = req.destination
-    pts = interpolate_geodesic(o.lat, o.lon, d.lat, d.lon, n=128)
+    pts = interpolate_geodesic(o.lat, o.lon, d.lat, d.lon)
     dist_nm = haversine_km(o.lat, o.lon, d.lat, d.lon) * KM_TO_NM
-    return {
+    out = {
         "type": "FeatureCollection",
         "features": [{
             "type": "Feature",
@@ -104,78 +217,1151 @@ def plan(req: PlanRequest):
             "properties": {"distance_nm": round(dist_nm, 2), "algo": "great_circle"},
         }],
     }
+    body = route_json(out)
+    route_cache.put(key, body)
+    return route_response(body)
+
+PLAN_BATCH_MAX = int(os.getenv("PLAN_BATCH_MAX", "1000000"))  # binary rows
+PLAN_BATCH_MAX_JSON = int(os.getenv("PLAN_BATCH_MAX_JSON", "100000"))
+PLAN_BATCH_MAX_GEOMETRIES = int(os.getenv("PLAN_BATCH_MAX_GEOMETRIES", "10000"))
+PLAN_BATCH_JSON_PAIR_BYTES = 128  # generous upper bound for one pair of JSON numbers
+
+def plan_batch_job(body: bytes, binary: bool, geometry: bool, max_seg_nm: Optional[float]) -> Response:
+    """Parse, compute and serialize one /plan/batch request (runs in the threadpool)."""
+    try:
+        if binary:
+            if len(body) % 32:
+                raise ValueError("body must be float64 rows of lat1, lon1, lat2, lon2")
+            lat1, lon1, lat2, lon2 = np.frombuffer(body, dtype="<f8").reshape(-1, 4).T
+        else:
+            data = json.loads(body)
+            lat1, lon1, lat2, lon2 = (np.asarray(data[k], dtype=float) for k in ("lat1", "lon1", "lat2", "lon2"))
+            if not lat1.ndim == 1 or not lat1.shape == lon1.shape == lat2.shape == lon2.shape:
+                raise ValueError("lat1, lon1, lat2, lon2 must be equal-length arrays")
+        if not all(np.isfinite(c).all() for c in (lat1, lon1, lat2, lon2)):
+            raise ValueError("coordinates must be finite")
+    except (ValueError, TypeError, KeyError) as e:
+        return JSONResponse(content={"error": f"bad batch: {e}"}, status_code=422)
+    limit = PLAN_BATCH_MAX_GEOMETRIES if geometry else PLAN_BATCH_MAX if binary else PLAN_BATCH_MAX_JSON
+    if len(lat1) > limit:
+        return JSONResponse(content={"error": f"at most {limit} pairs per batch"}, status_code=413)
+
+    dist_nm = haversine_km_np(lat1, lon1, lat2, lon2) * KM_TO_NM
+    bearing = initial_bearing_np(lat1, lon1, lat2, lon2)
+    if binary:
+        if geometry:
+            return JSONResponse(content={"error": "geometries need a JSON request"}, status_code=422)
+        return Response(content=np.column_stack([dist_nm, bearing]).astype("<f8").tobytes(),
+                        media_type="application/octet-stream")
+    out = {"distance_nm": np.round(dist_nm, 2).tolist(), "bearing_deg": np.round(bearing, 2).tolist()}
+    if geometry:
+        out["geometries"] = interpolate_geodesic_batch(lat1, lon1, lat2, lon2, max_seg_nm=max_seg_nm)
+    return Response(content=json.dumps(out, separators=(",", ":")), media_type="application/json")
+
+@app.post("/plan/batch")
+async def plan_batch(request: Request, geometry: bool = False, max_seg_nm: Optional[float] = Query(None, gt=0)):
+    """
+    Great-circle distance and initial bearing for many pairs in one vectorized pass.
+
+    JSON body: columns {"lat1": [...], "lon1": [...], "lat2": [...], "lon2": [...]};
+    answers {"distance_nm", "bearing_deg"} plus "geometries" when ?geometry=true.
+    application/octet-stream body: little-endian float64 rows (lat1, lon1, lat2, lon2);
+    answers float64 rows (distance_nm, bearing_deg) in the same encoding. JSON batches
+    are capped far lower (PLAN_BATCH_MAX_JSON) since parsing and encoding them is Python.
+    """
+    binary = request.headers.get("content-type", "").startswith("application/octet-stream")
+    limit = PLAN_BATCH_MAX if binary else PLAN_BATCH_MAX_JSON
+    max_bytes = limit * (32 if binary else PLAN_BATCH_JSON_PAIR_BYTES)
+    too_large = JSONResponse(content={"error": f"at most {limit} pairs per batch"}, status_code=413)
+    # Refuse oversized bodies before buffering them: by Content-Length when it is sent,
+    # else (chunked uploads) as soon as the bytes read pass the cap.
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes:
+        return too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            return too_large
+    body = bytes(body)
+    return await run_in_threadpool(plan_batch_job, body, binary, geometry, max_seg_nm)
+
+# ---- Routing grid ----
+LAT_LIMIT = 89.5
+
+class Grid:
+    """
+    Fixed lat/lon lattice for one grid_step_deg. Row r sits at lat (row0 + r) * step,
+    column c at lon -180 + c * lon_step (wrapping at the antimeridian).
+    """
+    def __init__(self, step: float):
+        self.step = step
+        self.row0 = ceil(-LAT_LIMIT / step - 1e-9)
+        self.nrows = floor(LAT_LIMIT / step + 1e-9) - self.row0 + 1
+        self.ncols = max(1, round(360.0 / step))
+        self.lon_step = 360.0 / self.ncols
+        self.lats = (np.arange(self.nrows) + self.row0) * step
+        self.lons = np.arange(self.ncols) * self.lon_step - 180.0
+
+    def row(self, lat: float) -> int:
+        return min(max(round(lat / self.step) - self.row0, 0), self.nrows - 1)
+
+    def col(self, lon: float) -> int:
+        return round((lon + 180.0) / self.lon_step) % self.ncols
+
+@lru_cache(maxsize=16)
+def get_grid(step: float) -> Grid:
+    return Grid(step)
+
+# Full-grid rasters are ~26 MB per bool layer at 0.05°, so per-step caches are bounded by
+# bytes, not entries. Memory-mapped rasters cost nothing here: their pages are shared.
+RASTER_CACHE_MB = int(os.getenv("RASTER_CACHE_MB", "512"))
+
+def raster_bytes(value) -> int:
+    if isinstance(value, tuple):
+        return sum(raster_bytes(v) for v in value)
+    if isinstance(value, np.ndarray) and not isinstance(value, np.memmap):
+        return value.nbytes
+    return 0
+
+class RasterCache:
+    """Thread-safe LRU of per-step rasters, shared by every raster cache in the process and bounded by bytes."""
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, bytes)
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        size = raster_bytes(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self.entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= self.entries.popitem(last=False)[1][1]
+
+    def memo(self, fn):
+        """Decorator: cache fn(*args) here, keyed by the function name and its (hashable) args."""
+        missing = object()
+
+        @wraps(fn)
+        def cached(*args):
+            key = (fn.__name__,) + args
+            value = self.get(key, missing)
+            if value is missing:
+                value = fn(*args)
+                self.put(key, value)
+            return value
+        return cached
+
+raster_cache = RasterCache(RASTER_CACHE_MB << 20)
+
+def hazards_key(hazards: List[HazardCircle]) -> Tuple[Tuple[float, float, float], ...]:
+    return tuple((h.lat, h.lon, h.radius_nm) for h in hazards)
+
+def disc_window(grid: Grid, lat: float, lon: float, radius_nm: float):
+    """
+    Row and column indices of the bounding box of a circle on `grid`, plus the (rows, cols)
+    distance matrix in nm from the centre; (None, None, None) if no row is in reach.
+    """
+    ρ = radius_nm * NM_TO_KM / R_KM
+    rows = np.nonzero(np.abs(grid.lats - lat) <= degrees(ρ) + grid.step)[0]
+    if rows.size == 0:
+        return None, None, None
+    cos_φ = cos(radians(lat))
+    if ρ >= 3.141592653589793 / 2 or sin(ρ) >= cos_φ:
+        cols = np.arange(grid.ncols)  # circle reaches over a pole
+    else:
+        half = ceil(degrees(asin(sin(ρ) / cos_φ)) / grid.lon_step) + 1
+        c0 = grid.col(lon)
+        cols = np.arange(c0 - half, c0 + half + 1) % grid.ncols if 2 * half + 1 < grid.ncols else np.arange(grid.ncols)
+    d_nm = haversine_km_np(grid.lats[rows][:, None], grid.lons[cols][None, :], lat, lon) * KM_TO_NM
+    return rows, cols, d_nm
+
+@raster_cache.memo
+def hazard_raster(step: float, key: Tuple[Tuple[float, float, float], ...]) -> np.ndarray:
+    """
+    Boolean (nrows, ncols) mask of grid cells inside any hazard circle.
+    Each circle only touches the rows/cols of its bounding box, evaluated in one NumPy pass.
+    """
+    grid = get_grid(step)
+    mask = np.zeros((grid.nrows, grid.ncols), dtype=bool)
+    for lat, lon, radius_nm in key:
+        rows, cols, d_nm = disc_window(grid, lat, lon, radius_nm)
+        if rows is not None:
+            mask[np.ix_(rows, cols)] |= d_nm <= radius_nm
+    mask.flags.writeable = False
+    return mask
+
+# ---- Static rasters (built offline, memory-mapped) ----
+RASTER_DIR = Path(os.getenv("RASTER_DIR", Path(__file__).parent / "data"))
+
+def map_rasters(prefix: str) -> dict:
+    """Memory-map every RASTER_DIR/<prefix>_<step>.npy, keyed by grid step."""
+    out = {}
+    for path in sorted(RASTER_DIR.glob(f"{prefix}_*.npy")):
+        try:
+            out[float(path.stem[len(prefix) + 1:])] = np.load(path, mmap_mode="r")
+        except Exception:
+            continue
+    return out
+
+def resample_nearest(src: np.ndarray, src_grid: Grid, grid: Grid) -> np.ndarray:
+    """Nearest-cell lookup of a (nrows, ncols) raster from src_grid onto grid."""
+    rows = np.clip(np.rint(grid.lats / src_grid.step) - src_grid.row0, 0, src_grid.nrows - 1).astype(np.intp)
+    cols = (np.rint((grid.lons + 180.0) / src_grid.lon_step) % src_grid.ncols).astype(np.intp)
+    return src[np.ix_(rows, cols)]
+
+LANDMASKS = map_rasters("landmask")  # step -> bit-packed rows, see build_landmask.py
+
+@raster_cache.memo
+def land_mask(step: float):
+    """
+    Boolean (nrows, ncols) land mask for this step, or None when no masks are installed.
+    Steps without their own file are resampled from the finest mask available.
+    """
+    if not LANDMASKS:
+        return None
+    grid = get_grid(step)
+    packed = LANDMASKS.get(step)
+    if packed is not None and packed.shape[0] == grid.nrows:
+        mask = np.unpackbits(packed, axis=1, count=grid.ncols).astype(bool)
+    else:
+        finest = min(LANDMASKS)
+        if finest == step:
+            return None
+        src = land_mask(finest)
+        if src is None:
+            return None
+        mask = resample_nearest(src, get_grid(finest), grid)
+    mask.flags.writeable = False
+    return mask
+
+BATHYMETRY = map_rasters("bathymetry")  # step -> int16 depth in m (positive down), see build_bathymetry.py
+SHALLOW_DEPTH_M = float(os.getenv("SHALLOW_DEPTH_M", "30"))
+
+@raster_cache.memo
+def depth_grid(step: float):
+    """
+    (nrows, ncols) depth raster for this step, or None when no bathymetry is installed.
+    A step with its own file is served straight from the shared memory map; other steps
+    are resampled from the finest raster available.
+    """
+    if not BATHYMETRY:
+        return None
+    grid = get_grid(step)
+    depth = BATHYMETRY.get(step)
+    if depth is not None and depth.shape == (grid.nrows, grid.ncols):
+        return depth
+    finest = min(BATHYMETRY)
+    src = BATHYMETRY[finest]
+    if finest == step or src.shape != (get_grid(finest).nrows, get_grid(finest).ncols):
+        return None
+    depth = resample_nearest(src, get_grid(finest), grid)
+    depth.flags.writeable = False
+    return depth
+
+# ---- Feed layers (spooled for the route workers) ----
+# Each feed version's parsed array, and its cost rasters for ROUTE_WARM_STEPS, are written
+# once to a spool directory. Route jobs carry a (version, path) handle and workers
+# memory-map the files, so feed history never travels with a job and the warm steps
+# are never rasterized on the request path.
+FEED_SPOOL_DIR = os.getenv("FEED_SPOOL_DIR")  # parent of the per-process spool; default: system temp
+FEED_SPOOL_KEEP = 4  # versions kept per feed, so jobs already queued can still load theirs
+
+_feed_spool = None
+_spooled = {}  # feed name -> spooled array paths, oldest first
+
+def feed_spool() -> Path:
+    global _feed_spool
+    if _feed_spool is None:
+        _feed_spool = Path(tempfile.mkdtemp(prefix="feeds-", dir=FEED_SPOOL_DIR))
+    return _feed_spool
+
+def remove_feed_spool():
+    global _feed_spool
+    if _feed_spool is not None:
+        shutil.rmtree(_feed_spool, ignore_errors=True)
+        _feed_spool = None
+        _spooled.clear()
+
+def raster_path(path: Path, step: float) -> Path:
+    return path.with_name(f"{path.stem}_{step:g}.npy")
+
+def save_npy(path: Path, array: np.ndarray):
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+def spool_feed(name: str, version: str, array: np.ndarray, build) -> Tuple[str, str]:
+    """
+    Write one feed version's array and its `build(grid, array)` rasters for
+    ROUTE_WARM_STEPS to the spool; returns the layer handle route jobs carry.
+    """
+    path = feed_spool() / f"{name}_{version}.npy"
+    for step in ROUTE_WARM_STEPS:
+        save_npy(raster_path(path, step), build(get_grid(step), array))
+    save_npy(path, array)
+    paths = _spooled.setdefault(name, [])
+    if path not in paths:
+        paths.append(path)
+    while len(paths) > FEED_SPOOL_KEEP:
+        old = paths.pop(0)
+        for f in old.parent.glob(f"{old.stem}*"):
+            f.unlink(missing_ok=True)
+    return version, str(path)
+
+def feed_raster(layer: Tuple[str, str], step: float, build) -> np.ndarray:
+    """
+    (nrows, ncols) raster of a spooled feed layer for this step: memory-mapped when it was
+    spooled for the step, else built from the layer's array. Kept in raster_cache.
+    """
+    path = Path(layer[1])
+    key = ("feed_raster", str(path), step)
+    raster = raster_cache.get(key)
+    if raster is not None:
+        return raster
+    try:
+        raster = np.load(raster_path(path, step), mmap_mode="r")
+    except OSError:
+        raster = build(get_grid(step), np.load(path))
+        raster.flags.writeable = False
+    raster_cache.put(key, raster)
+    return raster
+
+PIRACY_KDE_SIGMA_NM = float(os.getenv("PIRACY_KDE_SIGMA_NM", "120"))
+PIRACY_HALF_LIFE_DAYS = float(os.getenv("PIRACY_HALF_LIFE_DAYS", "365"))
+PIRACY_RISK_NM = float(os.getenv("PIRACY_RISK_NM", "200"))  # cost of entering a peak-risk cell at weight 1
+
+def piracy_incidents(data) -> np.ndarray:
+    """
+    (k, 3) array of lat, lon, weight from a piracy FeatureCollection. Weights decay with
+    incident age (half-life PIRACY_HALF_LIFE_DAYS); undated incidents weigh 1.
+    """
+    today = datetime.now(timezone.utc).date()
+    rows = []
+    for f in (data or {}).get("features") or []:
+        try:
+            lon, lat = (float(x) for x in f["geometry"]["coordinates"][:2])
+        except Exception:
+            continue
+        w = 1.0
+        date = (f.get("properties") or {}).get("date")
+        if date:
+            try:
+                age = (today - datetime.fromisoformat(str(date).replace("Z", "+00:00")[:10]).date()).days
+                w = 0.5 ** (max(age, 0) / PIRACY_HALF_LIFE_DAYS)
+            except ValueError:
+                pass
+        rows.append((lat, lon, w))
+    return np.array(rows, dtype=float).reshape(-1, 3)
+
+def piracy_risk(grid: Grid, incidents: np.ndarray) -> np.ndarray:
+    """
+    (nrows, ncols) float32 risk in nm, scaled so the peak is PIRACY_RISK_NM: a Gaussian
+    kernel density (sigma PIRACY_KDE_SIGMA_NM) of decay-weighted incidents. Incidents are
+    binned per cell, then smoothed along latitude and, per row, along longitude (sigma
+    widened by 1/cos(lat)) by FFT, so the cost does not grow with the incident history.
+    """
+    step, nrows, ncols = grid.step, grid.nrows, grid.ncols
+    density = np.zeros((nrows, ncols))
+    if len(incidents):
+        rows = np.clip(np.rint(incidents[:, 0] / step) - grid.row0, 0, nrows - 1).astype(np.intp)
+        cols = (np.rint((incidents[:, 1] + 180.0) / grid.lon_step) % ncols).astype(np.intp)
+        np.add.at(density, (rows, cols), incidents[:, 2])
+
+        sigma_deg = PIRACY_KDE_SIGMA_NM / 60.0
+        sig_r = sigma_deg / step
+        n = nrows + 2 * ceil(3 * sig_r)  # zero padding so the poles don't wrap into each other
+        f = np.fft.rfftfreq(n)
+        density = np.fft.irfft(np.fft.rfft(density, n=n, axis=0) * np.exp(-2 * (np.pi * sig_r * f) ** 2)[:, None],
+                               n=n, axis=0)[:nrows]
+        sig_c = sigma_deg / np.maximum(np.cos(np.radians(grid.lats)), 0.01) / grid.lon_step
+        f = np.fft.rfftfreq(ncols)
+        density = np.fft.irfft(np.fft.rfft(density, axis=1) * np.exp(-2 * (np.pi * sig_c[:, None] * f[None, :]) ** 2),
+                               n=ncols, axis=1)
+        np.maximum(density, 0.0, out=density)
+        peak = density.max()
+        if peak > 0:
+            density *= PIRACY_RISK_NM / peak
+    return density.astype(np.float32)
+
+# ---- Storm cost field ----
+STORM_COST_NM = float(os.getenv("STORM_COST_NM", "300"))  # cost of entering a storm core at weight 1
+# NHC forecast cone radii (nm) by lead time (h); the wind field is added on top.
+STORM_CONE_NM = ((12, 26.0), (24, 41.0), (36, 55.0), (48, 70.0), (72, 102.0))
+
+def storm_wind_radius_nm(intensity_kt: float) -> float:
+    """Rough radius of tropical-storm-force winds for a given max intensity."""
+    return min(250.0, 40.0 + 1.5 * max(intensity_kt, 0.0))
+
+def parse_coord(v, neg: str) -> float:
+    """30.5 or "30.5N" / "70.2W" -> signed degrees."""
+    if isinstance(v, (int, float)):
+        return float(v)
+    v = str(v).strip().upper()
+    return -float(v[:-1]) if v.endswith(neg) else float(v.rstrip("NSEW"))
+
+def storm_circles(data) -> np.ndarray:
+    """
+    (k, 4) array of lat, lon, radius_nm, weight from a storms payload: NHC
+    CurrentStorms.json (activeStorms) or a GeoJSON FeatureCollection of points. Each NHC
+    storm yields its current wind field plus forecast-cone circles, extrapolated along
+    its motion and weighted down with lead time.
+    """
+    out = []
+    for s in (data or {}).get("activeStorms") or []:
+        try:
+            lat = parse_coord(s.get("latitudeNumeric", s.get("latitude")), "S")
+            lon = parse_coord(s.get("longitudeNumeric", s.get("longitude")), "W")
+            wind = storm_wind_radius_nm(float(s.get("intensity") or 0))
+        except Exception:
+            continue
+        out.append((lat, lon, wind, 1.0))
+        try:
+            heading = radians(float(s.get("movementDir")))
+            speed_kt = float(s.get("movementSpeed")) * 0.868976  # NHC reports mph
+        except (TypeError, ValueError):
+            continue
+        for lead_h, cone_nm in STORM_CONE_NM:
+            δ = speed_kt * lead_h * NM_TO_KM / R_KM
+            φ1, λ1 = radians(lat), radians(lon)
+            φ2 = asin(sin(φ1) * cos(δ) + cos(φ1) * sin(δ) * cos(heading))
+            λ2 = λ1 + atan2(sin(heading) * sin(δ) * cos(φ1), cos(δ) - sin(φ1) * sin(φ2))
+            out.append((degrees(φ2), (degrees(λ2) + 540) % 360 - 180, wind + cone_nm, 1.0 / (1.0 + lead_h / 24.0)))
+    for f in (data or {}).get("features") or []:
+        try:
+            lon, lat = (float(x) for x in f["geometry"]["coordinates"][:2])
+        except Exception:
+            continue
+        props = f.get("properties") or {}
+        radius = props.get("radius_nm") or props.get("wind_radius_nm")
+        try:
+            radius = float(radius) if radius else storm_wind_radius_nm(float(props.get("intensity") or 0))
+        except (TypeError, ValueError):
+            radius = storm_wind_radius_nm(0)
+        out.append((lat, lon, radius, 1.0))
+    return np.array(out, dtype=float).reshape(-1, 4)
+
+def storm_cost(grid: Grid, circles: np.ndarray) -> np.ndarray:
+    """
+    (nrows, ncols) float32 storm cost in nm: each circle costs weight * STORM_COST_NM at
+    its centre, tapering to half at its edge; overlapping circles take the max.
+    """
+    cost = np.zeros((grid.nrows, grid.ncols), dtype=np.float32)
+    for lat, lon, radius_nm, w in circles.tolist():
+        rows, cols, d_nm = disc_window(grid, lat, lon, radius_nm)
+        if rows is None:
+            continue
+        ix = np.ix_(rows, cols)
+        c = np.where(d_nm <= radius_nm, w * STORM_COST_NM * (1.0 - 0.5 * d_nm / radius_nm), 0.0)
+        cost[ix] = np.maximum(cost[ix], c)
+    return cost
+
+def cell_costs(grid: Grid, hazards: List[HazardCircle], penalty_nm: float, keep=(),
+               piracy=None, piracy_weight=0.0, storms=None, storm_weight=0.0,
+               depth_penalty_nm=0.0, draft_m=0.0, block=True) -> np.ndarray:
+    """
+    Flat float32 cost (nm) of entering each cell: hazard penalty plus weighted piracy risk,
+    storm cost and shallow-water penalty, or inf for cells the router must never enter
+    (land, or water shallower than draft_m). Cells in `keep` (origin/goal) are never
+    blocked; block=False skips blocking altogether. `piracy` and `storms` are spooled
+    layer handles (see spool_feed).
+    """
+    cost = hazard_raster(grid.step, hazards_key(hazards)).reshape(-1) * np.float32(penalty_nm)
+    if piracy is not None and piracy_weight > 0:
+        cost += np.float32(piracy_weight) * feed_raster(piracy, grid.step, piracy_risk).reshape(-1)
+    if storms is not None and storm_weight > 0:
+        cost += np.float32(storm_weight) * feed_raster(storms, grid.step, storm_cost).reshape(-1)
+    blocked = land_mask(grid.step) if block else None
+    blocked = None if blocked is None else blocked.reshape(-1)
+    depth = depth_grid(grid.step) if depth_penalty_nm > 0 or draft_m > 0 else None
+    if depth is not None:
+        depth = depth.reshape(-1)
+        if depth_penalty_nm > 0:
+            cost += np.float32(depth_penalty_nm) * (depth < SHALLOW_DEPTH_M)
+        if draft_m > 0 and block:
+            blocked = depth < draft_m if blocked is None else blocked | (depth < draft_m)
+    if blocked is not None:
+        base = cost[list(keep)]
+        cost[blocked] = np.inf
+        cost[list(keep)] = base
+    return cost
 
 # ---- A* Avoid Routing ----
-def inside_hazard(lat: float, lon: float, hazards: List[HazardCircle]) -> bool:
-    for h in hazards:
-        d_km = haversine_km(lat, lon, h.lat, h.lon)
-        if d_km * KM_TO_NM <= h.radius_nm:
-            return True
-    return False
-
-def a_star_route(o: Waypoint, d: Waypoint, step=1.0, hazards=[], penalty_nm=200.0, max_nodes=200000):
-    def snap(x, s): return round(x / s) * s
-    start = (snap(o.lat, step), snap(o.lon, step))
-    goal  = (snap(d.lat, step), snap(d.lon, step))
-    dirs = [(0, step), (0, -step), (step, 0), (-step, 0), (step, step), (step, -step), (-step, step), (-step, -step)]
-    def h(n): return haversine_km(n[0], n[1], goal[0], goal[1]) * KM_TO_NM
+# 8-neighbourhood as (d_row, d_col); parent pointers store the index of the move into a cell.
+DIRS = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+@lru_cache(maxsize=16)
+def edge_lengths_nm(step: float) -> np.ndarray:
+    """
+    (nrows, 8) table of edge lengths in nm: entry [r, k] is the length of move DIRS[k]
+    out of any cell in row r. Moves that leave the grid are inf.
+    """
+    grid = get_grid(step)
+    table = np.full((grid.nrows, len(DIRS)), np.inf)
+    lat = grid.lats
+    for k, (dr, dc) in enumerate(DIRS):
+        lo, hi = max(0, -dr), grid.nrows - max(0, dr)
+        table[lo:hi, k] = haversine_km_np(lat[lo:hi], 0.0, lat[lo + dr:hi + dr], dc * grid.lon_step) * KM_TO_NM
+    table.flags.writeable = False
+    return table
+
+def trace_cells(grid: Grid, parent, cell: int) -> List[int]:
+    """Walk int8 parent directions back from `cell` to the search root."""
+    ncols = grid.ncols
+    path = [cell]
+    while parent[cell] >= 0:
+        dr, dc = DIRS[parent[cell]]
+        r, c = divmod(cell, ncols)
+        cell = (r - dr) * ncols + (c - dc) % ncols
+        path.append(cell)
+    path.reverse()
+    return path
+
+def cells_to_route(grid: Grid, cells: List[int]):
+    """Cell ids -> ([lon, lat] coords, total distance in nm)."""
+    lats, lons, ncols = grid.lats, grid.lons, grid.ncols
+    coords = []
+    total_nm = 0.0
+    for i, cell in enumerate(cells):
+        r, c = divmod(cell, ncols)
+        lat, lon = float(lats[r]), float(lons[c])
+        if i > 0:
+            total_nm += haversine_km(coords[-1][1], coords[-1][0], lat, lon) * KM_TO_NM
+        coords.append([lon, lat])
+    return coords, total_nm
+
+def densify_route(coords: List[list], max_seg_nm=None) -> List[list]:
+    """
+    [lon, lat] vertices joined by great-circle legs, with each leg sampled at least every
+    max_seg_nm (default GEODESIC_MAX_SEG_NM): renderers draw straight lon/lat segments,
+    which only follow a long leg (and stay clear of what it was checked against) when
+    the leg is densified.
+    """
+    if len(coords) < 2:
+        return coords
+    a, b = np.asarray(coords[:-1]), np.asarray(coords[1:])
+    legs = interpolate_geodesic_batch(a[:, 1], a[:, 0], b[:, 1], b[:, 0], max_seg_nm=max_seg_nm)
+    return legs[0] + [p for leg in legs[1:] for p in leg[1:]]
+
+def haversine_heuristic(grid: Grid, target: int):
+    """h(r, c): great-circle nm from cell (r, c) to `target`; admissible and consistent."""
+    lats, lons = grid.lats.tolist(), grid.lons.tolist()
+    tlat, tlon = lats[target // grid.ncols], lons[target % grid.ncols]
+    def h(r, c): return haversine_km(lats[r], lons[c], tlat, tlon) * KM_TO_NM
+    return h
+
+# ---- ALT landmarks (built offline, memory-mapped lazily) ----
+@lru_cache(maxsize=16)
+def landmark_table(step: float):
+    """
+    (ncells, L) float32 base-graph costs (nm) from each landmark to every cell for this
+    exact step, or None if RASTER_DIR has no matching landmarks_<step>.npy.
+    """
+    path = RASTER_DIR / f"landmarks_{step:g}.npy"
+    if not path.exists():
+        return None
+    grid = get_grid(step)
+    try:
+        table = np.load(path, mmap_mode="r")
+    except Exception:
+        return None
+    return table if table.ndim == 2 and table.shape[0] == grid.nrows * grid.ncols else None
+
+def alt_heuristic(grid: Grid, target: int):
+    """
+    h(r, c) from the triangle inequality over landmark tables, max'd with haversine.
+    Tables hold land-only base costs and every other cost term is non-negative, so the
+    bound stays admissible and consistent. Falls back to haversine without tables.
+    """
+    base = haversine_heuristic(grid, target)
+    table = landmark_table(grid.step)
+    if table is None:
+        return base
+    L, ncols = table.shape[1], grid.ncols
+    flat = table.reshape(-1).data
+    to_target = [(j, float(x)) for j, x in enumerate(table[target]) if x != inf]
+    if not to_target:
+        return base
+    def h(r, c):
+        i = (r * ncols + c) * L
+        best = base(r, c)
+        for j, dt in to_target:
+            dv = flat[i + j]
+            if dv == inf: continue
+            x = dt - dv if dt > dv else dv - dt
+            if x > best: best = x
+        return best
+    return h
+
+HEURISTICS = {"haversine": haversine_heuristic, "alt": alt_heuristic}
+
+def dijkstra_costs(grid: Grid, cell_nm, source: int, targets=(), max_nodes=None, parent=None) -> np.ndarray:
+    """
+    Single-source costs (nm) from `source` to every cell, float32, inf where unreachable.
+    With `targets`, stops as soon as all of them are settled (cells not settled by then
+    keep tentative or inf costs); `max_nodes` caps settled cells. A given int8 `parent`
+    array receives the shortest-path tree as move directions (see trace_cells).
+    """
+    nrows, ncols = grid.nrows, grid.ncols
+    edge_nm = edge_lengths_nm(grid.step).reshape(-1).tolist()
+    n = nrows * ncols
+    dist = np.full(n, np.inf, dtype=np.float32)
+    dv = dist.data
+    pv = parent.data if parent is not None else None
+    closed = bytearray(n)
+    pending = set(targets)
+    settled = 0
+    q = [(0.0, source, -1)]
+    dv[source] = 0.0
+    while q:
+        g, cur, move = heappop(q)
+        if closed[cur]: continue
+        closed[cur] = 1
+        if pv is not None: pv[cur] = move
+        if pending:
+            pending.discard(cur)
+            if not pending: break
+        settled += 1
+        if max_nodes is not None and settled > max_nodes: break
+        r, c = divmod(cur, ncols)
+        row_edges = r * 8
+        for k, (dr, dc) in enumerate(DIRS):
+            nr = r + dr
+            if nr < 0 or nr >= nrows: continue
+            nb = nr * ncols + (c + dc) % ncols
+            if closed[nb]: continue
+            enter = cell_nm[nb]
+            if enter == inf: continue
+            ng = g + edge_nm[row_edges + k] + enter
+            if ng < dv[nb]:
+                dv[nb] = ng
+                heappush(q, (ng, nb, k))
+    return dist
+
+def past(deadline) -> bool:
+    return deadline is not None and monotonic() > deadline
+
+def astar_search(grid: Grid, cell_nm, start: int, goal: int, max_nodes: int, heuristic=haversine_heuristic, deadline=None):
+    """
+    Plain A* over the 8-connected grid. Returns (cell path or None, nodes visited,
+    suboptimality bound); a path from this search is always optimal (bound 1.0).
+    """
+    nrows, ncols = grid.nrows, grid.ncols
+    h = heuristic(grid, goal)
+    edge_nm = edge_lengths_nm(grid.step).reshape(-1).tolist()
+
+    # Flat per-cell search state: float32 best g, int8 parent direction, closed flags.
+    n = nrows * ncols
+    bestg = np.full(n, np.inf, dtype=np.float32)
+    parent = np.full(n, -1, dtype=np.int8)
+    gv, pv = bestg.data, parent.data
+    closed = bytearray(n)
 
     openq = []
-    heappush(openq, (0 + h(start), 0.0, start, None))
-    came = {}
-    bestg = {start: 0.0}
+    heappush(openq, (h(start // ncols, start % ncols), 0.0, start, -1))
+    gv[start] = 0.0
     visited = 0
 
     while openq:
-        _, g, cur, parent = heappop(openq)
+        _, g, cur, k = heappop(openq)
         visited += 1
-        if cur in came:
+        if closed[cur]:
             continue
-        came[cur] = parent
+        closed[cur] = 1
+        pv[cur] = k
         if cur == goal: break
         if visited > max_nodes: break
+        if not visited & 1023 and past(deadline): break
 
-        for dy, dx in dirs:
-            nb = (cur[0] + dy, cur[1] + dx)
-            if nb[0] < -89.5 or nb[0] > 89.5: continue
-            lon = nb[1]
-            if lon < -180: lon += 360
-            if lon >  180: lon -= 360
-            nb = (nb[0], lon)
-
-            seg_nm = haversine_km(cur[0], cur[1], nb[0], nb[1]) * KM_TO_NM
-            cost = seg_nm + (penalty_nm if inside_hazard(nb[0], nb[1], hazards) else 0.0)
-            ng = g + cost
-            if nb not in bestg or ng < bestg[nb]:
-                bestg[nb] = ng
-                heappush(openq, (ng + h(nb), ng, nb, cur))
-
-    if goal not in came:
-        pts = interpolate_geodesic(o.lat, o.lon, d.lat, d.lon, n=128)
-        dist_nm = haversine_km(o.lat, o.lon, d.lat, d.lon) * KM_TO_NM
-        return pts, dist_nm, visited, False
+        r, c = divmod(cur, ncols)
+        row_edges = r * 8
+        for k, (dr, dc) in enumerate(DIRS):
+            nr = r + dr
+            if nr < 0 or nr >= nrows: continue
+            nc = (c + dc) % ncols
+            nb = nr * ncols + nc
+            if closed[nb]: continue
+            enter = cell_nm[nb]
+            if enter == inf: continue
+
+            ng = g + edge_nm[row_edges + k] + enter
+            if ng < gv[nb]:
+                gv[nb] = ng
+                heappush(openq, (ng + h(nr, nc), ng, nb, k))
+
+    if not closed[goal]:
+        return None, visited, None
+    return trace_cells(grid, pv, goal), visited, 1.0
+
+def bidirectional_search(grid: Grid, cell_nm, start: int, goal: int, max_nodes: int, heuristic=haversine_heuristic,
+                         deadline=None):
+    """
+    Symmetric bidirectional A*: a forward search from start and a backward search from
+    goal (over reversed edges), each with its own heuristic, always expanding
+    the smaller frontier. mu is the best start-goal cost seen where the two label sets
+    touch; the search stops once either frontier's smallest key reaches mu, at which
+    point mu is optimal. The base-graph landmark costs are symmetric, so ALT serves
+    both directions.
+    """
+    nrows, ncols = grid.nrows, grid.ncols
+    h_f = heuristic(grid, goal)
+    h_b = heuristic(grid, start)
+    edge_nm = edge_lengths_nm(grid.step).reshape(-1).tolist()
+
+    n = nrows * ncols
+    gf = np.full(n, np.inf, dtype=np.float32)
+    gb = np.full(n, np.inf, dtype=np.float32)
+    # pf: move that entered a cell on its best path from start;
+    # pb: move that leaves a cell on its best path to goal.
+    pf = np.full(n, -1, dtype=np.int8)
+    pb = np.full(n, -1, dtype=np.int8)
+    gfv, gbv, pfv, pbv = gf.data, gb.data, pf.data, pb.data
+    closed_f, closed_b = bytearray(n), bytearray(n)
+
+    qf = [(h_f(start // ncols, start % ncols), 0.0, start)]
+    qb = [(h_b(goal // ncols, goal % ncols), 0.0, goal)]
+    gfv[start] = 0.0
+    gbv[goal] = 0.0
+    mu, meet = (0.0, start) if start == goal else (inf, -1)
+    visited = 0
+
+    while qf and qb:
+        if qf[0][0] >= mu or qb[0][0] >= mu: break
+        if visited > max_nodes: return None, visited, None
+        if not visited & 1023 and past(deadline): return None, visited, None
+
+        if len(qf) <= len(qb):
+            _, g, cur = heappop(qf)
+            if closed_f[cur]: continue
+            closed_f[cur] = 1
+            visited += 1
+            r, c = divmod(cur, ncols)
+            row_edges = r * 8
+            for k, (dr, dc) in enumerate(DIRS):
+                nr = r + dr
+                if nr < 0 or nr >= nrows: continue
+                nc = (c + dc) % ncols
+                nb = nr * ncols + nc
+                if closed_f[nb]: continue
+                enter = cell_nm[nb]
+                if enter == inf: continue
+                ng = g + edge_nm[row_edges + k] + enter
+                if ng < gfv[nb]:
+                    gfv[nb] = ng
+                    pfv[nb] = k
+                    heappush(qf, (ng + h_f(nr, nc), ng, nb))
+                    if ng + gbv[nb] < mu:
+                        mu, meet = ng + gbv[nb], nb
+        else:
+            _, g, cur = heappop(qb)
+            if closed_b[cur]: continue
+            closed_b[cur] = 1
+            visited += 1
+            enter = cell_nm[cur]
+            r, c = divmod(cur, ncols)
+            for k, (dr, dc) in enumerate(DIRS):
+                pr = r - dr
+                if pr < 0 or pr >= nrows: continue
+                pc = (c - dc) % ncols
+                prev = pr * ncols + pc
+                if closed_b[prev] or cell_nm[prev] == inf: continue
+                ng = g + edge_nm[pr * 8 + k] + enter
+                if ng < gbv[prev]:
+                    gbv[prev] = ng
+                    pbv[prev] = k
+                    heappush(qb, (ng + h_b(pr, pc), ng, prev))
+                    if ng + gfv[prev] < mu:
+                        mu, meet = ng + gfv[prev], prev
+
+    if meet < 0:
+        return None, visited, None
+    path = trace_cells(grid, pfv, meet)
+    cell = meet
+    while pbv[cell] >= 0:
+        dr, dc = DIRS[pbv[cell]]
+        r, c = divmod(cell, ncols)
+        cell = (r + dr) * ncols + (c + dc) % ncols
+        path.append(cell)
+    return path, visited, 1.0
+
+ANYTIME_EPSILON = float(os.getenv("ANYTIME_EPSILON", "2.5"))
+
+def anytime_search(grid: Grid, cell_nm, start: int, goal: int, max_nodes: int, heuristic=haversine_heuristic,
+                   deadline=None):
+    """
+    ARA*: weighted A* with f = g + eps * h, lowering eps by 0.5 per round down to 1.0 and
+    reusing g-values between rounds (cells improved after closing wait in INCONS for the
+    next round). When the deadline or node cap hits, returns the best path so far and
+    its suboptimality bound g(goal) / min over OPEN and INCONS of (g + h).
+    """
+    nrows, ncols = grid.nrows, grid.ncols
+    h0 = heuristic(grid, goal)
+    hcache = {}
+    def h(cell):
+        v = hcache.get(cell)
+        if v is None:
+            v = hcache[cell] = h0(*divmod(cell, ncols))
+        return v
+    edge_nm = edge_lengths_nm(grid.step).reshape(-1).tolist()
+
+    n = nrows * ncols
+    bestg = np.full(n, np.inf, dtype=np.float32)
+    parent = np.full(n, -1, dtype=np.int8)
+    gv, pv = bestg.data, parent.data
+    closed = bytearray(n)
+
+    eps = max(1.0, ANYTIME_EPSILON)
+    gv[start] = 0.0
+    openq = [(eps * h(start), 0.0, start)]
+    incons = []
+    best, bound, visited = None, None, 0
+
+    while True:
+        stopped = False
+        while openq:
+            key, g, cur = openq[0]
+            if closed[cur] or g != gv[cur]:
+                heappop(openq)
+                continue
+            if gv[goal] <= key: break
+            if visited > max_nodes or (not visited & 255 and past(deadline)):
+                stopped = True
+                break
+            heappop(openq)
+            closed[cur] = 1
+            visited += 1
+
+            r, c = divmod(cur, ncols)
+            row_edges = r * 8
+            for k, (dr, dc) in enumerate(DIRS):
+                nr = r + dr
+                if nr < 0 or nr >= nrows: continue
+                nb = nr * ncols + (c + dc) % ncols
+                enter = cell_nm[nb]
+                if enter == inf: continue
+                ng = g + edge_nm[row_edges + k] + enter
+                if ng < gv[nb]:
+                    gv[nb] = ng
+                    pv[nb] = k
+                    if closed[nb]:
+                        incons.append(nb)
+                    else:
+                        ng = gv[nb]  # compare against the stored float32 when popping
+                        heappush(openq, (ng + eps * h(nb), ng, nb))
+
+        if gv[goal] == inf:
+            break
+        frontier = {c for _, g, c in openq if g == gv[c] and not closed[c]}
+        frontier.update(incons)
+        lower = min((gv[c] + h(c) for c in frontier), default=gv[goal])
+        ratio = gv[goal] / lower if lower > 0 else 1.0
+        best = trace_cells(grid, pv, goal)
+        bound = max(1.0, ratio if stopped else min(eps, ratio))
+        if stopped or bound <= 1.0 or past(deadline):
+            break
+
+        eps = max(1.0, eps - 0.5)
+        openq = [(gv[c] + eps * h(c), gv[c], c) for c in frontier]
+        heapify(openq)
+        incons = []
+        closed = bytearray(n)
+
+    return best, visited, bound
+
+SEARCHES = {"astar": astar_search, "bidirectional": bidirectional_search, "anytime": anytime_search}
+
+def any_angle_cells(grid: Grid, cost: np.ndarray, cells: List[int]) -> List[int]:
+    """
+    Line-of-sight post-pass over a grid path: from each kept vertex, jump to the farthest
+    later path cell whose great-circle leg crosses no blocked cell and costs no more
+    (length plus entry cost of every cell it crosses) than the stretch of path it
+    replaces. The farthest cell is found by galloping then bisecting along the path.
+    """
+    if len(cells) < 3:
+        return cells
+    nrows, ncols, row0, step, lon_step = grid.nrows, grid.ncols, grid.row0, grid.step, grid.lon_step
+    rs, cs = np.divmod(np.asarray(cells), ncols)
+    plat, plon = grid.lats[rs], grid.lons[cs]
+    legs = haversine_km_np(plat[:-1], plon[:-1], plat[1:], plon[1:]) * KM_TO_NM + cost[cells[1:]]
+    along = np.concatenate(([0.0], np.cumsum(legs)))
+
+    def visible(a: int, b: int) -> bool:
+        dc = abs(int(cs[b]) - int(cs[a]))
+        n = 3 * (abs(int(rs[b]) - int(rs[a])) + min(dc, ncols - dc)) + 2
+        lat, lon = geodesic_points_np(plat[a], plon[a], plat[b], plon[b], np.linspace(0.0, 1.0, n))
+        r = np.clip(np.rint(lat / step) - row0, 0, nrows - 1).astype(np.intp)
+        crossed = np.unique(r * ncols + (np.rint((lon + 180.0) / lon_step) % ncols).astype(np.intp))
+        crossed = crossed[crossed != cells[a]]
+        leg = haversine_km(plat[a], plon[a], plat[b], plon[b]) * KM_TO_NM + cost[crossed].sum()
+        return leg <= (along[b] - along[a]) * 1.000001
+
+    out, a, last = [cells[0]], 0, len(cells) - 1
+    while a < last:
+        ok, span = a + 1, 2
+        while a + span <= last and visible(a, a + span):
+            ok, span = a + span, span * 2
+        bad = min(a + span, last + 1)
+        while bad - ok > 1:
+            mid = (ok + bad) // 2
+            if visible(a, mid): ok = mid
+            else: bad = mid
+        out.append(cells[ok])
+        a = ok
+    return out
 
-    path, cur = [], goal
-    while cur is not None:
-        path.append(cur); cur = came[cur]
+def corridor_mask(grid: Grid, coarse: Grid, coarse_cells: List[int], width_deg: float) -> np.ndarray:
+    """
+    Boolean (nrows, ncols) mask on `grid` of cells within width_deg (per axis) of a path
+    found on the `coarse` grid. Windows are padded by one coarse step so consecutive
+    coarse cells leave no gaps.
+    """
+    nrows, ncols = grid.nrows, grid.ncols
+    mask = np.zeros((nrows, ncols), dtype=bool)
+    wr = ceil((width_deg + coarse.step) / grid.step)
+    wc = ceil((width_deg + coarse.lon_step) / grid.lon_step)
+    for cell in coarse_cells:
+        cr, cc = divmod(cell, coarse.ncols)
+        r, c = grid.row(float(coarse.lats[cr])), grid.col(float(coarse.lons[cc]))
+        r0, r1 = max(0, r - wr), min(nrows, r + wr + 1)
+        if 2 * wc + 1 >= ncols:
+            mask[r0:r1] = True
+            continue
+        c0, c1 = c - wc, c + wc + 1
+        mask[r0:r1, max(c0, 0):min(c1, ncols)] = True
+        if c0 < 0: mask[r0:r1, c0 % ncols:] = True
+        if c1 > ncols: mask[r0:r1, :c1 - ncols] = True
+    return mask
+
+# ---- Visibility graph (circular hazards only) ----
+# With hazard circles as the only obstacles, shortest routes run along great-circle
+# tangents and around the circles, so a graph over the hazard boundaries replaces the
+# global grid. Each circle is swapped for the circumscribed spherical polygon with
+# VISIBILITY_SIDES vertices (legs are then at most 1/cos(pi/sides) - 1 longer than the
+# exact tangent path, ~0.5% at 32 sides). Testing every vertex pair against every circle
+# is O((sides * H)^2 * H) for H hazards, so above VISIBILITY_MAX_HAZARDS the grid is
+# cheaper and is used instead; pairs are tested VISIBILITY_CHUNK at a time.
+VISIBILITY_SIDES = int(os.getenv("VISIBILITY_SIDES", "32"))
+VISIBILITY_MAX_HAZARDS = int(os.getenv("VISIBILITY_MAX_HAZARDS", "24"))
+VISIBILITY_CHUNK = 1 << 16
+R_NM = R_KM * KM_TO_NM
+
+def unit_vectors(lat, lon) -> np.ndarray:
+    φ, λ = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(φ) * np.cos(λ), np.cos(φ) * np.sin(λ), np.sin(φ)], axis=-1)
+
+def arc_between(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Central angle (rad) between unit vectors, stable for small and near-pi angles."""
+    return np.arctan2(np.linalg.norm(np.cross(a, b), axis=-1), np.sum(a * b, axis=-1))
+
+def circle_polygon(lat: float, lon: float, rho: float, sides: int):
+    """Vertices (lat, lon arrays) of the polygon circumscribing the circle of angular radius rho."""
+    r = np.arctan(np.tan(rho) / cos(np.pi / sides))
+    φ, λ = radians(lat), radians(lon)
+    θ = 2 * np.pi * np.arange(sides) / sides
+    φ2 = np.arcsin(sin(φ) * np.cos(r) + cos(φ) * np.sin(r) * np.cos(θ))
+    λ2 = λ + np.arctan2(np.sin(θ) * np.sin(r) * cos(φ), np.cos(r) - sin(φ) * np.sin(φ2))
+    return np.degrees(φ2), (np.degrees(λ2) + 540) % 360 - 180
+
+def segments_clear(a: np.ndarray, b: np.ndarray, centers: np.ndarray, rhos: np.ndarray) -> np.ndarray:
+    """
+    For great-circle segments a[i]-b[i] whose endpoints lie outside every circle: True
+    where no circle is entered. Such a segment enters circle c only if c's nearest point
+    on the great circle lies on the arc (c.(n x a) >= 0 and c.(b x n) >= 0 with n = a x b)
+    and that point is within rho (|c.n| < sin rho), so all tests are matrix products.
+    """
+    n = np.cross(a, b)
+    nn = np.linalg.norm(n, axis=-1, keepdims=True)
+    n = n / np.where(nn > 1e-12, nn, 1.0)
+    near = np.abs(n @ centers.T) < np.sin(rhos * (1 - 1e-6))  # polygon edges touch their circle
+    on_arc = (np.cross(n, a) @ centers.T >= 0) & (np.cross(b, n) @ centers.T >= 0)
+    return ~(near & on_arc).any(axis=1) | (nn[:, 0] <= 1e-12)
+
+def visibility_route(o: Waypoint, d: Waypoint, hazards: List[HazardCircle], step: float, max_nodes=None,
+                     deadline=None):
+    """
+    Shortest route avoiding every hazard circle over the visibility graph of the start,
+    goal and polygon vertices (dense Dijkstra). Returns (coords, distance nm, graph
+    nodes) or None when an endpoint sits inside a hazard, no route exists, or the graph
+    is over VISIBILITY_MAX_HAZARDS circles, max_nodes vertices or the deadline.
+    """
+    circles = [h for h in hazards if h.radius_nm > 0]
+    if len(circles) > VISIBILITY_MAX_HAZARDS:
+        return None
+    rhos = np.array([h.radius_nm / R_NM for h in circles])
+    if len(circles) and rhos.max() >= np.pi / 2 * cos(np.pi / VISIBILITY_SIDES):
+        return None
+    centers = unit_vectors(np.array([h.lat for h in circles]), np.array([h.lon for h in circles])).reshape(-1, 3)
+    lats, lons = [np.array([o.lat, d.lat])], [np.array([o.lon, d.lon])]
+    for h, rho in zip(circles, rhos):
+        la, lo = circle_polygon(h.lat, h.lon, rho, VISIBILITY_SIDES)
+        lats.append(la)
+        lons.append(lo)
+    lats, lons = np.concatenate(lats), np.concatenate(lons)
+    pts = unit_vectors(lats, lons)
+    inside = np.zeros(len(pts), dtype=bool)
+    for c, rho in zip(centers, rhos):
+        inside |= arc_between(pts, c[None, :]) < rho * (1 - 1e-6)
+    if inside[:2].any():
+        return None
+    keep = np.flatnonzero(~inside)
+    lats, lons, pts = lats[keep], lons[keep], pts[keep]
+
+    n = len(pts)
+    if max_nodes is not None and n > max_nodes:
+        return None
+    i, j = np.triu_indices(n, 1)
+    clear = np.empty(i.size, dtype=bool)
+    for s in range(0, i.size, VISIBILITY_CHUNK):
+        if past(deadline):
+            return None
+        e = s + VISIBILITY_CHUNK
+        clear[s:e] = segments_clear(pts[i[s:e]], pts[j[s:e]], centers, rhos)
+    i, j = i[clear], j[clear]
+    w = np.full((n, n), np.inf)
+    w[i, j] = w[j, i] = arc_between(pts[i], pts[j]) * R_NM
+
+    dist = np.full(n, np.inf)
+    prev = np.full(n, -1)
+    done = np.zeros(n, dtype=bool)
+    dist[0] = 0.0
+    while True:
+        u = int(np.argmin(np.where(done, np.inf, dist)))
+        if dist[u] == inf or u == 1:
+            break
+        if past(deadline):
+            return None
+        done[u] = True
+        nd = dist[u] + w[u]
+        better = (nd < dist) & ~done
+        dist[better] = nd[better]
+        prev[better] = u
+    if dist[1] == inf:
+        return None
+
+    path = [1]
+    while path[-1] != 0:
+        path.append(int(prev[path[-1]]))
     path.reverse()
+    coords = densify_route(np.column_stack([lons[path], lats[path]]).tolist(), step * 60.0)
+    return coords, float(dist[1]), n
 
-    total_nm = 0.0
-    coords = []
-    for i, node in enumerate(path):
-        if i > 0:
-            total_nm += haversine_km(path[i-1][0], path[i-1][1], node[0], node[1]) * KM_TO_NM
-        coords.append([node[1], node[0]])
-    return coords, total_nm, visited, True
+def a_star_route(o: Waypoint, d: Waypoint, step=1.0, hazards=[], penalty_nm=200.0, max_nodes=200000, algo="astar",
+                 hierarchical=False, coarse_step=None, corridor_deg=2.0, heuristic="haversine", deadline_ms=None,
+                 piracy=None, piracy_weight=0.0, storms=None, storm_weight=0.0, depth_penalty_nm=0.0, draft_m=0.0,
+                 costs=cell_costs, any_angle=False, deadline_at=None):
+    """
+    Route o -> d; returns (coords, distance nm, nodes visited, routed?, suboptimality bound,
+    search actually used). The bound is None when it is unknown: the visibility graph
+    inflates hazards to polygons and a corridor search is optimal only within its corridor. algo="visibility" falls back to A* on the grid when land,
+    weather, piracy or depth layers are in play, there are too many hazards, or the
+    graph finds no route within max_nodes and the deadline.
+    deadline_at (wall clock) overrides deadline_ms; either way building the cost
+    field counts against the budget.
+    """
+    if deadline_at is not None:
+        deadline = monotonic() + (deadline_at - time())
+    else:
+        deadline = monotonic() + deadline_ms / 1000.0 if deadline_ms else None
+    if algo == "visibility":
+        layered = piracy_weight > 0 or storm_weight > 0 or depth_penalty_nm > 0 or draft_m > 0
+        if not layered and land_mask(step) is None:
+            out = visibility_route(o, d, hazards, step, max_nodes, deadline)
+            if out is not None:
+                return out[0], out[1], out[2], True, None, "visibility"
+        algo = "astar"
+    grid = get_grid(step)
+    start = grid.row(o.lat) * grid.ncols + grid.col(o.lon)
+    goal = grid.row(d.lat) * grid.ncols + grid.col(d.lon)
+    layers = dict(piracy=piracy, piracy_weight=piracy_weight, storms=storms, storm_weight=storm_weight,
+                  depth_penalty_nm=depth_penalty_nm, draft_m=draft_m)
+    cost = costs(grid, hazards, penalty_nm, keep=(start, goal), **layers)
+    search = partial(SEARCHES[algo], heuristic=HEURISTICS[heuristic], deadline=deadline)
 
-@app.post("/plan_avoid")
-def plan_avoid(req: AvoidRequest):
-    coords, dist_nm, visited, used_astar = a_star_route(
+    cells, visited, bound = None, 0, None
+    coarse_step = coarse_step or max(1.0, 4 * step)
+    if hierarchical and coarse_step > step:
+        # Solve on the coarse grid, then refine on the fine grid inside a corridor around it.
+        cgrid = get_grid(coarse_step)
+        cstart = cgrid.row(o.lat) * cgrid.ncols + cgrid.col(o.lon)
+        cgoal = cgrid.row(d.lat) * cgrid.ncols + cgrid.col(d.lon)
+        ccells, visited, _ = search(cgrid, costs(cgrid, hazards, penalty_nm, keep=(cstart, cgoal), **layers).data,
+                                    cstart, cgoal, max_nodes)
+        if ccells is not None:
+            corridor = corridor_mask(grid, cgrid, ccells, corridor_deg).reshape(-1)
+            corridor[[start, goal]] = True
+            cells, v, _ = search(grid, np.where(corridor, cost, np.float32(np.inf)).data, start, goal, max_nodes)
+            visited += v
+
+    if cells is None and not past(deadline):
+        cells, v, bound = search(grid, cost.data, start, goal, max_nodes)
+        visited += v
+    if cells is None:
+        pts = interpolate_geodesic(o.lat, o.lon, d.lat, d.lon)
+        dist_nm = haversine_km(o.lat, o.lon, d.lat, d.lon) * KM_TO_NM
+        return pts, dist_nm, visited, False, None, algo
+
+    if any_angle:
+        cells = any_angle_cells(grid, cost, cells)
+    coords, total_nm = cells_to_route(grid, cells)
+    if any_angle:
+        coords = densify_route(coords)
+    return coords, total_nm, visited, True, bound, algo
+
+def shared_cell_costs(field_key: str, grid: Grid, hazards, penalty_nm, keep=(), **layers) -> np.ndarray:
+    """
+    cell_costs for jobs that share hazards and settings (field_key identifies them): the
+    field is built once per worker and step (while raster_cache has room for it), and each
+    call only re-opens its own `keep` cells on a copy.
+    """
+    key = ("shared_cell_costs", field_key, grid.step)
+    fields = raster_cache.get(key)
+    if fields is None:
+        fields = (cell_costs(grid, hazards, penalty_nm, block=False, **layers),
+                  cell_costs(grid, hazards, penalty_nm, **layers))
+        raster_cache.put(key, fields)
+    cost = fields[1].copy()
+    keep = list(keep)
+    cost[keep] = fields[0][keep]
+    return cost
+
+def plan_avoid_job(req: AvoidRequest, piracy=None, storms=None, field_key=None, deadline_at=None) -> dict:
+    coords, dist_nm, visited, used_astar, bound, search = a_star_route(
         req.origin, req.destination,
         step=req.grid_step_deg,
         hazards=req.hazards,
         penalty_nm=req.penalty_nm,
         max_nodes=req.max_nodes,
+        algo=req.algo,
+        hierarchical=req.hierarchical,
+        coarse_step=req.coarse_step_deg,
+        corridor_deg=req.corridor_deg,
+        heuristic=req.heuristic,
+        deadline_ms=req.deadline_ms,
+        piracy=piracy,
+        piracy_weight=req.piracy_weight,
+        storms=storms,
+        storm_weight=req.storm_weight,
+        depth_penalty_nm=req.depth_penalty_nm,
+        draft_m=req.draft_m,
+        costs=partial(shared_cell_costs, field_key) if field_key else cell_costs,
+        any_angle=req.any_angle,
+        deadline_at=deadline_at,
     )
     return {
         "type": "FeatureCollection",
@@ -185,6 +1371,11 @@ def plan_avoid(req: AvoidRequest):
             "properties": {
                 "distance_nm": round(dist_nm, 2),
                 "algo": "astar" if used_astar else "great_circle",
+                "search": search,
+                "hierarchical": req.hierarchical,
+                "any_angle": req.any_angle,
+                "heuristic": "alt" if req.heuristic == "alt" and landmark_table(req.grid_step_deg) is not None else "haversine",
+                "suboptimality": None if bound is None else round(bound, 3),
                 "visited": visited,
                 "grid_step_deg": req.grid_step_deg,
                 "hazards": len(req.hazards),
@@ -192,46 +1383,926 @@ def plan_avoid(req: AvoidRequest):
         }],
     }
 
+# ---- Route workers ----
+# Searches are pure Python and hold the GIL, so they run in a process pool; each worker
+# keeps its own warm lru caches (grids, edge tables, masks) across jobs. Every uvicorn
+# worker owns a pool, so by default the CPUs are split across WEB_CONCURRENCY (the
+# variable uvicorn reads for --workers) rather than each pool taking all of them.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+ROUTE_WORKERS = int(os.getenv("ROUTE_WORKERS", str(max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))))  # 0 = run in the threadpool
+ROUTE_QUEUE_MAX = int(os.getenv("ROUTE_QUEUE_MAX", str(4 * max(ROUTE_WORKERS, 1))))
+ROUTE_RETRY_AFTER_S = int(os.getenv("ROUTE_RETRY_AFTER_S", "2"))
+ROUTE_WARM_STEPS = [float(x) for x in os.getenv("ROUTE_WARM_STEPS", "1.0").split(",") if x.strip()]
+
+_route_pool = None
+_route_inflight = 0
+
+def warm_route_worker(steps: List[float]):
+    for step in steps:
+        get_grid(step)
+        edge_lengths_nm(step)
+        land_mask(step)
+        landmark_table(step)
+
+def start_route_pool():
+    global _route_pool
+    if ROUTE_WORKERS > 0 and _route_pool is None:
+        _route_pool = ProcessPoolExecutor(
+            max_workers=ROUTE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_route_worker,
+            initargs=(ROUTE_WARM_STEPS,),
+        )
+
+def stop_route_pool():
+    global _route_pool
+    if _route_pool is not None:
+        _route_pool.shutdown(wait=False, cancel_futures=True)
+        _route_pool = None
+
+async def run_route(fn, *args, shed=True):
+    """
+    Run a route job in the process pool (or the threadpool when ROUTE_WORKERS=0).
+    Answers 429 with Retry-After once ROUTE_QUEUE_MAX jobs are running or queued, unless
+    shed=False (callers that bound their own concurrency).
+    """
+    global _route_inflight
+    if _route_pool is None:
+        return await run_in_threadpool(fn, *args)
+    if shed and _route_inflight >= ROUTE_QUEUE_MAX:
+        return JSONResponse(content={"error": "route workers busy, retry later"}, status_code=429,
+                            headers={"Retry-After": str(ROUTE_RETRY_AFTER_S)})
+    _route_inflight += 1
+    pool = _route_pool
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        # Every job on a broken pool fails at once; only the first caller replaces it,
+        # later ones must not shut down the fresh pool (and cancel its jobs).
+        if _route_pool is pool:
+            stop_route_pool()
+            start_route_pool()
+        return JSONResponse(content={"error": "route worker crashed"}, status_code=503,
+                            headers={"Retry-After": str(ROUTE_RETRY_AFTER_S)})
+    finally:
+        _route_inflight -= 1
+
+# ---- Route result cache ----
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "2048"))
+ROUTE_CACHE_TTL_S = float(os.getenv("ROUTE_CACHE_TTL_S", "900"))
+ROUTE_CACHE_QUANTUM_DEG = float(os.getenv("ROUTE_CACHE_QUANTUM_DEG", "0.0001"))  # ~11 m
+
+def route_json(out: dict) -> bytes:
+    return json.dumps(out, separators=(",", ":")).encode()
+
+def route_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+class RouteCache:
+    """
+    Thread-safe LRU + TTL map of finished route responses, with hit/miss counters.
+    Routes are kept serialized (route_json) so a hit is sent without re-encoding.
+    """
+    def __init__(self, maxsize: int, ttl_s: float):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.entries = OrderedDict()  # key -> (expires_at, response)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (monotonic() + self.ttl_s, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries),
+                    "maxsize": self.maxsize, "ttl_s": self.ttl_s}
+
+route_cache = RouteCache(ROUTE_CACHE_SIZE, ROUTE_CACHE_TTL_S)
+
+def route_cache_key(kind: str, req, *feeds) -> tuple:
+    """
+    Quantized origin/destination + every other request field, hazards as a digest, plus
+    the feed snapshots (version first) the route is computed from, so a route can never
+    be served under a newer feed version than the one it was planned with.
+    """
+    def q(x): return round(x / ROUTE_CACHE_QUANTUM_DEG)
+    o, d = req.origin, req.destination
+    rest = req.model_dump(exclude={"origin", "destination", "hazards"})
+    hazards = getattr(req, "hazards", None)
+    digest = hashlib.sha1(repr(hazards_key(hazards)).encode()).hexdigest() if hazards else ""
+    versions = tuple(f and f[0] for f in feeds)
+    return (kind, q(o.lat), q(o.lon), q(d.lat), q(d.lon), tuple(sorted(rest.items())), digest, versions)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return route_cache.stats()
+
+@app.post("/plan_avoid")
+async def plan_avoid(req: AvoidRequest):
+    # deadline_ms runs from arrival, so feed refreshes and pool queueing count against it
+    deadline_at = time() + req.deadline_ms / 1000.0 if req.deadline_ms else None
+    piracy = await piracy_snapshot() if req.piracy_weight > 0 else None
+    storms = storm_snapshot() if req.storm_weight > 0 else None
+    key = route_cache_key("plan_avoid", req, piracy, storms)
+    hit = route_cache.get(key)
+    if hit is not None:
+        return route_response(hit)
+    out = await run_route(plan_avoid_job, req, piracy, storms, None, deadline_at)
+    if not isinstance(out, dict):
+        return out
+    return route_response(cache_route(key, req, out))
+
+def cache_route(key, req: AvoidRequest, out: dict) -> bytes:
+    """Serialize a finished route and cache it unless it is deadline-limited; returns the JSON."""
+    body = route_json(out)
+    # A deadline-limited answer depends on load at the time; don't pin it for the TTL.
+    if not req.deadline_ms or out["features"][0]["properties"]["suboptimality"] == 1.0:
+        route_cache.put(key, body)
+    return body
+
+BATCH_MAX_PAIRS = int(os.getenv("BATCH_MAX_PAIRS", "1000"))
+
+@app.post("/plan_avoid/batch")
+async def plan_avoid_batch(req: AvoidBatchRequest):
+    """
+    Route every pair under one set of hazards and settings. Streams NDJSON lines
+    {"index", "route"} or {"index", "error"} as pairs finish (not in request order); each
+    worker builds the shared cost field once for the whole batch.
+    """
+    if len(req.pairs) > BATCH_MAX_PAIRS:
+        return JSONResponse(content={"error": f"at most {BATCH_MAX_PAIRS} pairs per batch"}, status_code=413)
+    piracy = await piracy_snapshot() if req.piracy_weight > 0 else None
+    storms = storm_snapshot() if req.storm_weight > 0 else None
+    settings = req.model_dump(exclude={"pairs"})
+    field_key = hashlib.sha1(json.dumps([settings, piracy and piracy[0], storms and storms[0]],
+                                        sort_keys=True).encode()).hexdigest()
+    slots = asyncio.Semaphore(max(ROUTE_WORKERS, 1))  # one job per worker; the rest wait here
+
+    async def route_pair(i: int, pair: PlanRequest) -> bytes:
+        single = AvoidRequest(origin=pair.origin, destination=pair.destination, **settings)
+        key = route_cache_key("plan_avoid", single, piracy, storms)
+        body = route_cache.get(key)
+        if body is None:
+            async with slots:
+                # each pair's deadline runs from dispatch, not from the start of the batch
+                deadline_at = time() + single.deadline_ms / 1000.0 if single.deadline_ms else None
+                try:
+                    out = await run_route(plan_avoid_job, single, piracy, storms, field_key, deadline_at, shed=False)
+                except Exception as e:
+                    return json.dumps({"index": i, "error": str(e)}).encode() + b"\n"
+            if not isinstance(out, dict):
+                return json.dumps({"index": i, "error": json.loads(out.body)["error"]}).encode() + b"\n"
+            body = cache_route(key, single, out)
+        return b'{"index":%d,"route":%s}\n' % (i, body)
+
+    async def lines():
+        tasks = [asyncio.ensure_future(route_pair(i, p)) for i, p in enumerate(req.pairs)]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# ---- Distance matrix ----
+MATRIX_MAX_POINTS = int(os.getenv("MATRIX_MAX_POINTS", "500"))
+
+def matrix_row_job(req: MatrixRequest, i: int, piracy=None, storms=None, field_key=None) -> dict:
+    """
+    One Dijkstra from origin i that stops once every destination is settled; returns the
+    cost and the length of the cost-optimal route to each destination (None: unreachable).
+    """
+    grid = get_grid(req.grid_step_deg)
+    def cell(p): return grid.row(p.lat) * grid.ncols + grid.col(p.lon)
+    dests = [cell(p) for p in (req.destinations if req.destinations is not None else req.origins)]
+    if not dests:
+        return {"cost_nm": [], "distance_nm": []}
+    source = cell(req.origins[i])
+    # every origin/destination cell stays enterable, as a port on a coastal land cell must be
+    keep = set(dests) | {cell(p) for p in req.origins}
+    cost = shared_cell_costs(field_key, grid, req.hazards, req.penalty_nm, keep=keep,
+                             piracy=piracy, piracy_weight=req.piracy_weight,
+                             storms=storms, storm_weight=req.storm_weight,
+                             depth_penalty_nm=req.depth_penalty_nm, draft_m=req.draft_m)
+    parent = np.full(cost.size, -1, dtype=np.int8)
+    dist = dijkstra_costs(grid, cost.data, source, targets=dests, max_nodes=req.max_nodes, parent=parent)
+    costs, lengths = [], []
+    for d in dests:
+        if d == source:
+            costs.append(0.0)
+            lengths.append(0.0)
+        elif parent[d] < 0:
+            costs.append(None)
+            lengths.append(None)
+        else:
+            costs.append(round(float(dist[d]), 2))
+            lengths.append(round(cells_to_route(grid, trace_cells(grid, parent, d))[1], 2))
+    return {"cost_nm": costs, "distance_nm": lengths}
+
+@app.post("/matrix")
+async def matrix(req: MatrixRequest):
+    """
+    Origin x destination matrix over the hazard-aware grid: one early-stopping Dijkstra
+    per origin (in the route workers) instead of one search per pair. distance_nm is the
+    length of the least-cost route, cost_nm its cost including penalties; null where a
+    destination is unreachable or beyond the optional max_nodes cap.
+    """
+    n, m = len(req.origins), len(req.destinations if req.destinations is not None else req.origins)
+    if max(n, m) > MATRIX_MAX_POINTS:
+        return JSONResponse(content={"error": f"at most {MATRIX_MAX_POINTS} origins/destinations"}, status_code=413)
+    piracy = await piracy_snapshot() if req.piracy_weight > 0 else None
+    storms = storm_snapshot() if req.storm_weight > 0 else None
+    field_key = hashlib.sha1(json.dumps([req.model_dump(), piracy and piracy[0], storms and storms[0]],
+                                        sort_keys=True).encode()).hexdigest()
+    slots = asyncio.Semaphore(max(ROUTE_WORKERS, 1))
+
+    async def row(i: int):
+        async with slots:
+            return await run_route(matrix_row_job, req, i, piracy, storms, field_key, shed=False)
+
+    rows = await asyncio.gather(*(row(i) for i in range(n)))
+    for r in rows:
+        if not isinstance(r, dict):
+            return r
+    return {
+        "origins": n,
+        "destinations": m,
+        "grid_step_deg": req.grid_step_deg,
+        "distance_nm": [r["distance_nm"] for r in rows],
+        "cost_nm": [r["cost_nm"] for r in rows],
+    }
+
+# ---- Voyages: incremental replanning (D* Lite) ----
+# A registered voyage keeps its search state in this process, so re-running it after a
+# hazard or feed change only repairs the cells whose cost moved instead of searching
+# from scratch. State is per-voyage float32 g, rhs and cost over the whole grid (~12
+# bytes a cell plus the queue), so VOYAGES_MAX_CELLS bounds the grid cells held across
+# all voyages, least recently used evicted first. Replans run D* Lite in the threadpool
+# and hold the GIL, so at most VOYAGE_REPLANS_MAX run at once; up to
+# VOYAGE_REPLAN_QUEUE_MAX more wait their turn and the rest get a 429.
+VOYAGES_MAX = int(os.getenv("VOYAGES_MAX", "256"))
+VOYAGES_MAX_CELLS = int(os.getenv("VOYAGES_MAX_CELLS", "32000000"))  # ~400 MB of state
+VOYAGE_REPLANS_MAX = int(os.getenv("VOYAGE_REPLANS_MAX", "1"))
+VOYAGE_REPLAN_QUEUE_MAX = int(os.getenv("VOYAGE_REPLAN_QUEUE_MAX", "16"))
+
+class DStarLite:
+    """
+    D* Lite (Koenig & Likhachev, 2002) over the 8-connected grid. Searches backward from
+    the goal, so g[s] is the cost-to-go from s and a moving start only shifts the keys
+    (km). The priority queue persists between compute() calls; stale entries are skipped
+    lazily when popped.
+    """
+    def __init__(self, grid: Grid, cost: np.ndarray, start: int, goal: int):
+        n = grid.nrows * grid.ncols
+        self.grid, self.start, self.goal = grid, start, goal
+        self.cost = cost
+        self.g = np.full(n, np.inf, dtype=np.float32)
+        self.rhs = np.full(n, np.inf, dtype=np.float32)
+        self.rhs[goal] = 0.0
+        self.km = 0.0
+        self.h = haversine_heuristic(grid, start)
+        self.edge_nm = edge_lengths_nm(grid.step).reshape(-1).tolist()
+        self.queue = [(self.h(*divmod(goal, grid.ncols)), 0.0, goal)]
+
+    def best_rhs(self, s: int) -> float:
+        """min over successors of edge + enter cost + g."""
+        nrows, ncols = self.grid.nrows, self.grid.ncols
+        cost, g, edge_nm = self.cost.data, self.g.data, self.edge_nm
+        r, c = divmod(s, ncols)
+        best = inf
+        for k, (dr, dc) in enumerate(DIRS):
+            nr = r + dr
+            if nr < 0 or nr >= nrows: continue
+            nb = nr * ncols + (c + dc) % ncols
+            x = edge_nm[r * 8 + k] + cost[nb] + g[nb]
+            if x < best: best = x
+        return best
+
+    def push(self, s: int):
+        g, rhs = self.g[s], self.rhs[s]
+        if g != rhs:
+            m = float(min(g, rhs))
+            heappush(self.queue, (m + self.h(*divmod(s, self.grid.ncols)) + self.km, m, s))
+
+    def move_to(self, start: int):
+        if start != self.start:
+            self.km += self.h(*divmod(start, self.grid.ncols))
+            self.start = start
+            self.h = haversine_heuristic(self.grid, start)
+
+    def update_costs(self, cost: np.ndarray) -> int:
+        """Swap in a new cost field and repair rhs around every cell whose cost changed."""
+        changed = np.flatnonzero(cost != self.cost)
+        old = self.cost
+        self.cost = cost
+        # Edges into a cell the backward search never reached cost inf + g = inf either way.
+        touched = changed[np.isfinite(self.g[changed])]
+        nrows, ncols, goal = self.grid.nrows, self.grid.ncols, self.goal
+        g, rhs, edge_nm = self.g.data, self.rhs.data, self.edge_nm
+        for v, was, now in zip(touched.tolist(), old[touched].tolist(), cost[touched].tolist()):
+            # entering v got cheaper or dearer: every neighbour's outgoing edge into v moved
+            r, c = divmod(v, ncols)
+            for k, (dr, dc) in enumerate(DIRS):
+                nr = r + dr
+                if nr < 0 or nr >= nrows: continue
+                p = nr * ncols + (c + dc) % ncols
+                if p == goal: continue
+                if now < was:
+                    x = edge_nm[r * 8 + k] + now + g[v]
+                    if x >= rhs[p]: continue
+                    rhs[p] = x
+                elif edge_nm[r * 8 + k] + was + g[v] <= rhs[p] * 1.000001:
+                    rhs[p] = self.best_rhs(p)  # v may have been p's best successor
+                else:
+                    continue
+                self.push(p)
+        return changed.size
+
+    def compute(self, max_nodes: int) -> int:
+        """Expand until the start is consistent; returns expansions (max_nodes+1 if cut off)."""
+        nrows, ncols, goal, start = self.grid.nrows, self.grid.ncols, self.goal, self.start
+        cost, g, rhs, edge_nm, h, km = self.cost.data, self.g.data, self.rhs.data, self.edge_nm, self.h, self.km
+        queue = self.queue
+        hs = h(*divmod(start, ncols))
+        visited = 0
+        while queue:
+            k1, k2, u = queue[0]
+            gu, ru = g[u], rhs[u]
+            if gu == ru:
+                heappop(queue)
+                continue
+            gs, rs = g[start], rhs[start]
+            # Keys along straight runs tie with the start's up to float noise, which breaks
+            # lexicographic order; expand the whole tie band (extra expansions are safe).
+            if gs == rs and k1 > (gs + hs + km) * 1.000001:
+                break
+            if visited >= max_nodes:
+                # leave u queued so the next call resumes where this one stopped
+                return visited + 1
+            heappop(queue)
+            r, c = divmod(u, ncols)
+            m = min(gu, ru)
+            knew = m + h(r, c) + km
+            if (k1, k2) < (knew, m):
+                heappush(queue, (knew, m, u))
+                continue
+            visited += 1
+
+            if gu > ru:
+                g[u] = ru
+                enter = cost[u]
+                if enter == inf: continue
+                for k, (dr, dc) in enumerate(DIRS):
+                    nr = r + dr
+                    if nr < 0 or nr >= nrows: continue
+                    p = nr * ncols + (c + dc) % ncols
+                    if p == goal: continue
+                    # edge lengths are symmetric, so p -> u costs edge[r, k] + enter
+                    x = ru + edge_nm[r * 8 + k] + enter
+                    if x < rhs[p]:
+                        rhs[p] = x
+                        self.push(p)
+            else:
+                g[u] = inf
+                if u != goal:
+                    rhs[u] = self.best_rhs(u)
+                self.push(u)
+                for dr, dc in DIRS:
+                    nr = r + dr
+                    if nr < 0 or nr >= nrows: continue
+                    p = nr * ncols + (c + dc) % ncols
+                    if p == goal: continue
+                    rhs[p] = self.best_rhs(p)
+                    self.push(p)
+        return visited
+
+    def path(self) -> Optional[List[int]]:
+        """Greedy descent of g from the start, or None when the goal is unreachable."""
+        nrows, ncols = self.grid.nrows, self.grid.ncols
+        cost, g, edge_nm = self.cost.data, self.g.data, self.edge_nm
+        cur, cells = self.start, [self.start]
+        if g[cur] == inf:
+            return None
+        while cur != self.goal:
+            if len(cells) > nrows * ncols:
+                return None
+            r, c = divmod(cur, ncols)
+            best, nxt = inf, -1
+            for k, (dr, dc) in enumerate(DIRS):
+                nr = r + dr
+                if nr < 0 or nr >= nrows: continue
+                nb = nr * ncols + (c + dc) % ncols
+                x = edge_nm[r * 8 + k] + cost[nb] + g[nb]
+                if x < best: best, nxt = x, nb
+            if nxt < 0:
+                return None
+            cur = nxt
+            cells.append(cur)
+        return cells
+
+class Voyage:
+    """A registered /plan_avoid request plus its D* Lite state; replans are serialized."""
+    def __init__(self, req: AvoidRequest):
+        self.req = req
+        self.engine = None
+        self.lock = threading.Lock()
+        grid = get_grid(req.grid_step_deg)
+        self.cells = grid.nrows * grid.ncols
+
+    def costs(self, grid: Grid, start: int, goal: int, piracy, storms) -> np.ndarray:
+        req = self.req
+        return cell_costs(grid, req.hazards, req.penalty_nm, keep=(start, goal),
+                          piracy=piracy, piracy_weight=req.piracy_weight,
+                          storms=storms, storm_weight=req.storm_weight,
+                          depth_penalty_nm=req.depth_penalty_nm, draft_m=req.draft_m)
+
+    def replan(self, vid: str, piracy=None, storms=None, position: Optional[Waypoint] = None,
+               hazards: Optional[List[HazardCircle]] = None) -> dict:
+        with self.lock:
+            if position is not None:
+                self.req = self.req.model_copy(update={"origin": position})
+            if hazards is not None:
+                self.req = self.req.model_copy(update={"hazards": hazards})
+            req = self.req
+            grid = get_grid(req.grid_step_deg)
+            o, d = req.origin, req.destination
+            start = grid.row(o.lat) * grid.ncols + grid.col(o.lon)
+            goal = grid.row(d.lat) * grid.ncols + grid.col(d.lon)
+            cost = self.costs(grid, start, goal, piracy, storms)
+            if self.engine is None:
+                self.engine, changed = DStarLite(grid, cost, start, goal), cost.size
+            else:
+                self.engine.move_to(start)
+                changed = self.engine.update_costs(cost)
+            visited = self.engine.compute(req.max_nodes)
+            cells = self.engine.path() if visited <= req.max_nodes else None
+            if cells is not None and req.any_angle:
+                cells = any_angle_cells(grid, cost, cells)
+
+        if cells is None:
+            coords = interpolate_geodesic(o.lat, o.lon, d.lat, d.lon)
+            dist_nm = haversine_km(o.lat, o.lon, d.lat, d.lon) * KM_TO_NM
+        else:
+            coords, dist_nm = cells_to_route(grid, cells)
+            if req.any_angle:
+                coords = densify_route(coords)
+        return {
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": coords},
+                "properties": {
+                    "voyage_id": vid,
+                    "distance_nm": round(dist_nm, 2),
+                    "algo": "astar" if cells is not None else "great_circle",
+                    "search": "dstar_lite",
+                    "changed_cells": int(changed),
+                    "visited": visited,
+                    "grid_step_deg": req.grid_step_deg,
+                    "hazards": len(req.hazards),
+                },
+            }],
+        }
+
+voyages = OrderedDict()  # id -> Voyage, least recently used first
+_voyages_lock = threading.Lock()
+_replan_slots = asyncio.Semaphore(max(VOYAGE_REPLANS_MAX, 1))
+_replans_pending = 0  # replans running or waiting for a slot
+
+def replans_busy() -> Optional[JSONResponse]:
+    """A 429 once every replan slot and VOYAGE_REPLAN_QUEUE_MAX waiters are taken, else None."""
+    if _replans_pending < max(VOYAGE_REPLANS_MAX, 1) + VOYAGE_REPLAN_QUEUE_MAX:
+        return None
+    return JSONResponse(content={"error": "replanning busy, retry later"}, status_code=429,
+                        headers={"Retry-After": str(ROUTE_RETRY_AFTER_S)})
+
+def get_voyage(vid: str) -> Optional[Voyage]:
+    with _voyages_lock:
+        voyage = voyages.get(vid)
+        if voyage is not None:
+            voyages.move_to_end(vid)
+        return voyage
+
+class VoyageUpdate(BaseModel):
+    position: Optional[Waypoint] = None  # current vessel position; becomes the new origin
+    hazards: Optional[List[HazardCircle]] = None  # replaces the voyage's hazards
+
+async def replan_voyage(vid: str, voyage: Voyage, update: Optional[VoyageUpdate] = None):
+    global _replans_pending
+    busy = replans_busy()
+    if busy is not None:
+        return busy
+    _replans_pending += 1
+    try:
+        async with _replan_slots:
+            req = voyage.req
+            piracy = await piracy_snapshot() if req.piracy_weight > 0 else None
+            storms = storm_snapshot() if req.storm_weight > 0 else None
+            update = update or VoyageUpdate()
+            return await run_in_threadpool(voyage.replan, vid, piracy, storms, update.position, update.hazards)
+    finally:
+        _replans_pending -= 1
+
+@app.post("/voyages")
+async def create_voyage(req: AvoidRequest):
+    """Register a voyage and plan it; later replans reuse its search state."""
+    voyage = Voyage(req)
+    if voyage.cells > VOYAGES_MAX_CELLS:
+        return JSONResponse(content={"error": "grid_step_deg too fine for a voyage"}, status_code=413)
+    busy = replans_busy()
+    if busy is not None:
+        return busy
+    vid = uuid.uuid4().hex
+    with _voyages_lock:
+        voyages[vid] = voyage
+        held = sum(v.cells for v in voyages.values())
+        while len(voyages) > VOYAGES_MAX or held > VOYAGES_MAX_CELLS:
+            held -= voyages.popitem(last=False)[1].cells
+    return await replan_voyage(vid, voyage)
+
+@app.post("/voyages/{vid}/replan")
+async def voyage_replan(vid: str, update: Optional[VoyageUpdate] = None):
+    """Repair the voyage's route after a position, hazard or feed change."""
+    voyage = get_voyage(vid)
+    if voyage is None:
+        return JSONResponse(content={"error": "unknown voyage"}, status_code=404)
+    return await replan_voyage(vid, voyage, update)
+
+@app.delete("/voyages/{vid}")
+def delete_voyage(vid: str):
+    with _voyages_lock:
+        if voyages.pop(vid, None) is None:
+            return JSONResponse(content={"error": "unknown voyage"}, status_code=404)
+    return {"deleted": vid}
+
 # ---------- DATA FEEDS ----------
+# One pooled client for every upstream feed, so keep-alive connections (and their TLS
+# sessions) are reused across requests; HTTP/2 is used when the h2 package is installed.
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "20"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "10"))
+UPSTREAM_KEEPALIVE_S = float(os.getenv("UPSTREAM_KEEPALIVE_S", "60"))
+UPSTREAM_CONNECT_TIMEOUT_S = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_S", "5"))
+PIRACY_TIMEOUT_S = float(os.getenv("PIRACY_TIMEOUT_S", "20"))
+STORMS_TIMEOUT_S = float(os.getenv("STORMS_TIMEOUT_S", "20"))
+
+_upstream = None
+
+def upstream_client() -> httpx.AsyncClient:
+    """The shared upstream client; opened by the app lifespan (or on first use)."""
+    global _upstream
+    if _upstream is None:
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        _upstream = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS,
+                                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                                keepalive_expiry=UPSTREAM_KEEPALIVE_S),
+            timeout=httpx.Timeout(20.0, connect=UPSTREAM_CONNECT_TIMEOUT_S),
+            headers={"Accept": "application/json"},
+        )
+    return _upstream
+
+async def close_upstream_client():
+    global _upstream
+    if _upstream is not None:
+        await _upstream.aclose()
+        _upstream = None
+
+def upstream_timeout(total_s: float) -> httpx.Timeout:
+    return httpx.Timeout(total_s, connect=min(total_s, UPSTREAM_CONNECT_TIMEOUT_S))
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls per key: the first caller starts fn, later callers await
+    the same in-flight task and get its result or its exception. Nothing is kept once
+    it settles, and a caller that goes away does not cancel the shared call.
+    """
+    def __init__(self):
+        self.flights = {}
+
+    async def do(self, key, fn, *args):
+        task = self.flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args))
+            self.flights[key] = task
+            task.add_done_callback(partial(self._settled, key))
+        return await asyncio.shield(task)
+
+    async def cancel_all(self):
+        """Cancel every call in flight and wait for them to unwind (app shutdown)."""
+        tasks = list(self.flights.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _settled(self, key, task):
+        self.flights.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+upstream_flights = SingleFlight()
+
 PIRACY_GCS_URL = os.getenv("PIRACY_GCS_URL")  # e.g. https://storage.googleapis.com/hacknation-piracy-nada/piracy.geojson
 LOCAL_PIRACY = Path(__file__).parent / "data" / "piracy.geojson"
 
-@app.get("/data/piracy")
-async def piracy_feed():
+feed_versions = {}  # feed name -> digest of the last payload served
+
+def note_feed(name: str, body: bytes):
     """
-    Try GCS URL (env), then local backend/data/piracy.geojson, else empty FeatureCollection.
+    Record a feed payload's version. Route cache keys carry the feed versions they were
+    planned with, so a new version needs no invalidation: routes on the old one are
+    simply never hit again and age out, and routes that don't use the feed stay valid.
     """
+    feed_versions[name] = hashlib.sha1(body).hexdigest()
+
+PIRACY_TTL_S = float(os.getenv("PIRACY_TTL_S", "300"))
+
+class FeedCache:
+    """
+    Process-level copy of one upstream feed: raw bytes, parsed JSON and the validators
+    to revalidate it. Callers serve it from memory while fresh() and revalidate through
+    upstream_flights afterwards, so only one upstream request is in flight per feed.
+    `variants` holds compressed copies of `raw` per Content-Encoding (None when
+    compressing does not pay), built on first request and dropped with each new payload.
+    """
+    def __init__(self, name: str, ttl_s: float):
+        self.name = name
+        self.ttl_s = ttl_s
+        self.raw = None
+        self.data = None
+        self.media_type = "application/json"
+        self.variants = {}
+        self.etag = None
+        self.last_modified = None
+        self.version = None
+        self.checked_at = -inf  # monotonic, drives fresh()
+        self.validated_at = None  # wall clock of the last upstream confirmation, for Age
+
+    def fresh(self) -> bool:
+        return self.raw is not None and monotonic() - self.checked_at < self.ttl_s
+
+    def validators(self) -> dict:
+        headers = {}
+        if self.etag: headers["If-None-Match"] = self.etag
+        if self.last_modified: headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def touch(self):
+        self.checked_at = monotonic()
+
+    def confirm(self):
+        """Upstream says the cached copy is current (304 or unchanged file)."""
+        self.touch()
+        self.validated_at = time()
+
+    def store(self, raw: bytes, data, etag=None, last_modified=None, media_type=None):
+        self.raw, self.data, self.etag, self.last_modified = raw, data, etag, last_modified
+        # GCS serves objects uploaded without a type as octet-stream
+        self.media_type = media_type if media_type and "json" in media_type else "application/json"
+        self.variants = {}
+        note_feed(self.name, raw)
+        self.version = feed_versions[self.name]
+        self.confirm()
+
+    def age_s(self) -> int:
+        return max(0, int(time() - self.validated_at)) if self.validated_at is not None else 0
+
+piracy_cache = FeedCache("piracy", PIRACY_TTL_S)
+
+FEED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)  # server preference
+
+def compress_feed(raw: bytes, encoding: str) -> Optional[bytes]:
+    body = brotli.compress(raw, quality=11) if encoding == "br" else gzip.compress(raw, compresslevel=9, mtime=0)
+    return body if len(body) < len(raw) else None
+
+def pick_encoding(accept: str) -> Optional[str]:
+    """Preferred FEED_ENCODINGS entry the Accept-Encoding header allows (q > 0), or None."""
+    q = {}
+    for part in accept.split(","):
+        name, _, params = part.strip().lower().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, val = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(val)
+                except ValueError:
+                    weight = 0.0
+        q[name.strip()] = weight
+    best = max(FEED_ENCODINGS, key=lambda e: q.get(e, q.get("*", 0.0)))
+    return best if q.get(best, q.get("*", 0.0)) > 0 else None
+
+async def feed_response(request: Request, cache: FeedCache, headers: Optional[dict] = None) -> Response:
+    """
+    cache.raw passed through verbatim, or a cached compressed variant negotiated from
+    Accept-Encoding. Each representation has a strong ETag derived from the payload
+    digest, and a matching If-None-Match gets a bodyless 304.
+    """
+    raw, version = cache.raw, cache.version
+    encoding = pick_encoding(request.headers.get("accept-encoding", ""))
+    body = raw
+    if encoding is not None:
+        if encoding not in cache.variants:
+            variant = await upstream_flights.do((cache.name, version, encoding),
+                                                run_in_threadpool, compress_feed, raw, encoding)
+            if cache.version == version:
+                cache.variants[encoding] = variant
+        else:
+            variant = cache.variants[encoding]
+        if variant is None:
+            encoding = None
+        else:
+            body = variant
+    etag = f'"{version}-{encoding}"' if encoding else f'"{version}"'
+    headers = {**(headers or {}), "ETag": etag, "Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or etag in (t.strip().removeprefix("W/") for t in inm.split(","))):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=cache.media_type, headers=headers)
+
+async def fetch_piracy():
+    """
+    (raw bytes, parsed GeoJSON) from piracy_cache, revalidated once PIRACY_TTL_S has
+    passed: the GCS URL (env) with If-None-Match/If-Modified-Since, so an unchanged
+    object costs a 304; then the local backend/data/piracy.geojson, checked by mtime.
+    A failed GCS check keeps serving the cached copy. None when there is no source;
+    raises if the local file is not valid JSON.
+    """
+    if piracy_cache.fresh():
+        return piracy_cache.raw, piracy_cache.data
+    return await upstream_flights.do("piracy", revalidate_piracy)
+
+async def revalidate_piracy():
+    cache = piracy_cache
     # 1) Try GCS
     if PIRACY_GCS_URL:
         try:
-            async with httpx.AsyncClient(timeout=20) as client:
-                r = await client.get(PIRACY_GCS_URL, headers={"Accept": "application/json"})
+            r = await upstream_client().get(PIRACY_GCS_URL, headers=cache.validators(),
+                                            timeout=upstream_timeout(PIRACY_TIMEOUT_S))
+            if r.status_code == 304 and cache.raw is not None:
+                cache.confirm()
+            else:
                 r.raise_for_status()
-                return JSONResponse(content=r.json())
-        except Exception as e:
+                cache.store(r.content, r.json(), r.headers.get("etag"), r.headers.get("last-modified"),
+                            r.headers.get("content-type"))
+            return cache.raw, cache.data
+        except Exception:
+            if cache.raw is not None:
+                cache.touch()  # retry after another TTL rather than on every request
+                return cache.raw, cache.data
             # fall through to local file
-            pass
 
     # 2) Try local file
     if LOCAL_PIRACY.exists():
-        try:
-            with LOCAL_PIRACY.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-            return JSONResponse(content=data)
-        except Exception as e:
-            return JSONResponse(content={"error": f"Local piracy.json invalid: {e}"}, status_code=500)
+        etag = f'"mtime-{LOCAL_PIRACY.stat().st_mtime_ns}"'
+        if etag == cache.etag:
+            cache.confirm()
+        else:
+            raw = LOCAL_PIRACY.read_bytes()
+            cache.store(raw, json.loads(raw), etag)
+        return cache.raw, cache.data
+    return None
+
+@app.get("/data/piracy")
+async def piracy_feed(request: Request):
+    """
+    Try GCS URL (env), then local backend/data/piracy.geojson, else empty FeatureCollection.
+    The cached upstream bytes are passed through as-is (see feed_response).
+    """
+    try:
+        got = await fetch_piracy()
+    except Exception as e:
+        return JSONResponse(content={"error": f"Local piracy.json invalid: {e}"}, status_code=500)
+    if got is None:
+        # Empty but valid GeoJSON
+        return {"type": "FeatureCollection", "features": []}
+    return await feed_response(request, piracy_cache)
+
+_piracy_snapshot = {"version": None, "layer": None}
 
-    # 3) Empty but valid GeoJSON
-    return {"type": "FeatureCollection", "features": []}
+def spool_piracy(version: str, data) -> Tuple[str, str]:
+    return spool_feed("piracy", version, piracy_incidents(data), piracy_risk)
+
+async def piracy_snapshot():
+    """
+    Spooled layer handle (feed version, path) for the piracy cost layer, following
+    piracy_cache, or None without a feed. Each new version is parsed and spooled once,
+    in the threadpool; the last good handle is kept if a refresh fails.
+    """
+    try:
+        got = await fetch_piracy()
+    except Exception:
+        got = None
+    version = piracy_cache.version
+    if got is not None and version != _piracy_snapshot["version"]:
+        layer = await upstream_flights.do(("spool", "piracy", version), run_in_threadpool, spool_piracy, version, got[1])
+        _piracy_snapshot.update(version=version, layer=layer)
+    return _piracy_snapshot["layer"]
 
 STORMS_SRC = os.getenv("STORMS_SRC", "https://www.nhc.noaa.gov/CurrentStorms.json")
+STORMS_REFRESH_S = float(os.getenv("STORMS_REFRESH_S", "600"))
+STORMS_CACHE_PATH = Path(os.getenv("STORMS_CACHE_PATH", Path(__file__).parent / "data" / "storms_cache.json"))
+storms_cache = FeedCache("storms", STORMS_REFRESH_S)
+_storm_snapshot = {"version": None, "layer": None}
 
-@app.get("/storms")
-async def storms():
+def storm_snapshot():
+    """Spooled layer handle (feed version, path) for the storm cost layer, or None before the first refresh."""
+    return _storm_snapshot["layer"]
+
+def spool_storms(version: str, data) -> Tuple[str, str]:
+    return spool_feed("storms", version, storm_circles(data), storm_cost)
+
+async def update_storm_snapshot():
+    """Parse and spool a new storms version in the background refresher, off the request path."""
+    version = storms_cache.version
+    if version != _storm_snapshot["version"]:
+        layer = await run_in_threadpool(spool_storms, version, storms_cache.data)
+        _storm_snapshot.update(version=version, layer=layer)
+
+def save_storms(raw: bytes):
+    """Keep the last good payload on disk for cold starts (atomic replace)."""
+    tmp = STORMS_CACHE_PATH.with_suffix(".tmp")
     try:
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.get(STORMS_SRC, headers={"Accept": "application/json"})
-            r.raise_for_status()
-            return JSONResponse(content=r.json())
-    except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=502)
+        STORMS_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_bytes(raw)
+        os.replace(tmp, STORMS_CACHE_PATH)
+    except OSError:
+        pass
+
+async def load_storms_from_disk():
+    """Seed storms_cache from STORMS_CACHE_PATH at startup; Age counts from the file's mtime."""
+    try:
+        raw = STORMS_CACHE_PATH.read_bytes()
+        data = json.loads(raw)
+        mtime = STORMS_CACHE_PATH.stat().st_mtime
+    except (OSError, ValueError):
+        return
+    storms_cache.store(raw, data)
+    storms_cache.validated_at = mtime
+    await update_storm_snapshot()
+
+async def refresh_storms():
+    cache = storms_cache
+    r = await upstream_client().get(STORMS_SRC, headers=cache.validators(), timeout=upstream_timeout(STORMS_TIMEOUT_S))
+    if r.status_code == 304 and cache.raw is not None:
+        cache.confirm()
+        return
+    r.raise_for_status()
+    data = r.json()
+    cache.store(r.content, data, r.headers.get("etag"), r.headers.get("last-modified"), r.headers.get("content-type"))
+    await run_in_threadpool(save_storms, r.content)
+    await update_storm_snapshot()
+
+async def refresh_storms_forever():
+    """Background task (app lifespan): poll STORMS_SRC every STORMS_REFRESH_S."""
+    while True:
+        try:
+            await upstream_flights.do("storms", refresh_storms)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass  # keep the last good payload
+        await asyncio.sleep(STORMS_REFRESH_S)
+
+@app.get("/storms")
+async def storms(request: Request):
+    """
+    Last good STORMS_SRC payload, kept by the background refresher (stale-while-
+    revalidate), so upstream latency never reaches the client. Age is seconds since
+    upstream last confirmed it. Before the first load, requests join one shared fetch.
+    """
+    if storms_cache.raw is None:
+        try:
+            await upstream_flights.do("storms", refresh_storms)
+        except Exception as e:
+            return JSONResponse(content={"error": f"storm feed not loaded yet: {e}"}, status_code=503,
+                                headers={"Retry-After": str(ROUTE_RETRY_AFTER_S)})
+    return await feed_response(request, storms_cache, {"Age": str(storms_cache.age_s())})
@@ -0,0 +1,151 @@
+"""
+Feed caching checks: /data/piracy against a stand-in GCS (httpx.MockTransport), so
+revalidation and fallbacks run without the network.
+
+    cd backend && python -m pytest -q
+"""
+import asyncio
+import hashlib
+import json
+from math import inf
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+GCS_URL = "https://gcs.test/piracy.geojson"
+
+def feed(count: int) -> bytes:
+    features = [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [40.0 + i / 10, 12.0]},
+                 "properties": {"date": "2024-01-01"}} for i in range(count)]
+    return json.dumps({"type": "FeatureCollection", "features": features}).encode()
+
+class Upstream:
+    """Stand-in GCS object: ETag from the body, 304 on a matching If-None-Match, 503 while failing."""
+    def __init__(self, body: bytes):
+        self.body = body
+        self.fail = False
+        self.delay_s = 0.0
+        self.statuses = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.delay_s)
+        etag = f'"{hashlib.md5(self.body).hexdigest()}"'
+        if self.fail:
+            response = httpx.Response(503)
+        elif request.headers.get("if-none-match") == etag:
+            response = httpx.Response(304, headers={"ETag": etag})
+        else:
+            response = httpx.Response(200, content=self.body,
+                                      headers={"ETag": etag, "Content-Type": "application/octet-stream"})
+        self.statuses.append(response.status_code)
+        return response
+
+@pytest.fixture
+def upstream(monkeypatch, tmp_path):
+    gcs = Upstream(feed(50))
+    monkeypatch.setattr(main, "PIRACY_GCS_URL", GCS_URL)
+    monkeypatch.setattr(main, "LOCAL_PIRACY", tmp_path / "piracy.geojson")  # absent
+    monkeypatch.setattr(main, "piracy_cache", main.FeedCache("piracy", main.PIRACY_TTL_S))
+    monkeypatch.setattr(main, "_upstream", httpx.AsyncClient(transport=httpx.MockTransport(gcs)))
+    return gcs
+
+def expire():
+    main.piracy_cache.checked_at = -inf
+
+def test_piracy_revalidates_and_serves_cached_copy_when_gcs_fails(upstream):
+    client = TestClient(main.app)
+    first = client.get("/data/piracy")
+    assert first.status_code == 200 and first.content == upstream.body
+    assert first.headers["content-type"] == "application/json"
+    assert client.get("/data/piracy").content == upstream.body
+    assert upstream.statuses == [200]  # fresh: served from memory
+
+    expire()
+    assert client.get("/data/piracy").content == upstream.body
+    assert upstream.statuses == [200, 304]
+
+    upstream.body = feed(60)
+    expire()
+    assert client.get("/data/piracy").content == upstream.body
+    assert upstream.statuses == [200, 304, 200]
+
+    upstream.fail = True
+    expire()
+    stale = client.get("/data/piracy")
+    assert stale.status_code == 200 and stale.content == upstream.body
+    assert client.get("/data/piracy").status_code == 200
+    assert upstream.statuses == [200, 304, 200, 503]  # a failed check is not retried until the TTL passes
+
+def get_concurrently(path: str, count: int):
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.get(path) for _ in range(count)))
+    return asyncio.run(run())
+
+def test_concurrent_piracy_misses_share_one_fetch(upstream):
+    upstream.delay_s = 0.05
+    responses = get_concurrently("/data/piracy", 20)
+    assert all(r.status_code == 200 and r.content == upstream.body for r in responses)
+    assert upstream.statuses == [200]
+
+    upstream.fail = True
+    expire()
+    main.piracy_cache.raw = None  # cold again: no cached copy to fall back to
+    responses = get_concurrently("/data/piracy", 20)
+    assert all(r.json() == {"type": "FeatureCollection", "features": []} for r in responses)
+    assert upstream.statuses == [200, 503]
+
+def test_single_flight_shares_one_failure():
+    calls = []
+
+    async def boom():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        flights = main.SingleFlight()
+        results = await asyncio.gather(*(flights.do("k", boom) for _ in range(5)), return_exceptions=True)
+        assert flights.flights == {}
+        with pytest.raises(RuntimeError):
+            await flights.do("k", boom)  # a settled failure is not kept
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(calls) == 2
+
+@pytest.mark.parametrize("accept, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZIP; q=0.8, deflate", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=0, *", None),
+    ("*;q=0, gzip;q=0.5", "gzip"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("gzip;q=bogus", None),
+])
+def test_pick_encoding_honours_q_values(accept, expected):
+    assert main.pick_encoding(accept) == expected
+
+def test_piracy_feed_negotiates_gzip_and_answers_if_none_match(upstream):
+    client = TestClient(main.app)
+    plain = client.get("/data/piracy", headers={"Accept-Encoding": "identity"})
+    zipped = client.get("/data/piracy", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in plain.headers and plain.content == upstream.body
+    assert zipped.headers["content-encoding"] == "gzip" and zipped.content == upstream.body
+    assert zipped.num_bytes_downloaded < len(upstream.body)
+    assert all("Accept-Encoding" in r.headers["vary"] for r in (plain, zipped))
+    assert plain.headers["etag"] != zipped.headers["etag"]
+
+    for accept, first in (("identity", plain), ("gzip", zipped)):
+        again = client.get("/data/piracy", headers={"Accept-Encoding": accept, "If-None-Match": first.headers["etag"]})
+        assert again.status_code == 304 and again.content == b""
+        assert again.headers["etag"] == first.headers["etag"]
+    other = client.get("/data/piracy", headers={"Accept-Encoding": "identity", "If-None-Match": zipped.headers["etag"]})
+    assert other.status_code == 200 and other.content == upstream.body
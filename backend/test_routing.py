@@ -0,0 +1,127 @@
+"""
+Search correctness checks: every router must agree with a plain Dijkstra over the same
+cost field. Small coarse grids with random hazards keep this fast.
+
+    cd backend && python -m pytest -q
+"""
+import numpy as np
+import pytest
+
+from main import (DIRS, KM_TO_NM, VISIBILITY_MAX_HAZARDS, DStarLite, HazardCircle, Waypoint, a_star_route,
+                  cell_costs, dijkstra_costs, edge_lengths_nm, get_grid, haversine_km_np, SEARCHES)
+
+STEP = 4.0
+
+def random_hazards(rng, count: int):
+    return [HazardCircle(lat=float(rng.uniform(-60, 60)), lon=float(rng.uniform(-180, 180)),
+                         radius_nm=float(rng.uniform(100, 600))) for _ in range(count)]
+
+def random_cells(rng, grid, count: int):
+    rows = rng.integers(2, grid.nrows - 2, count)
+    cols = rng.integers(0, grid.ncols, count)
+    return (rows * grid.ncols + cols).tolist()
+
+def path_cost(grid, cost, cells) -> float:
+    """Edge lengths plus entry cost of every cell after the first, as the searches count it."""
+    edge_nm = edge_lengths_nm(grid.step)
+    total = 0.0
+    for a, b in zip(cells, cells[1:]):
+        (ra, ca), (rb, cb) = divmod(a, grid.ncols), divmod(b, grid.ncols)
+        dc = (cb - ca + 1) % grid.ncols - 1
+        k = DIRS.index((rb - ra, dc))
+        total += edge_nm[ra, k] + cost[b]
+    return total
+
+@pytest.mark.parametrize("algo", ["astar", "bidirectional", "anytime"])
+@pytest.mark.parametrize("seed", range(4))
+def test_search_matches_dijkstra(algo, seed):
+    rng = np.random.default_rng(seed)
+    grid = get_grid(STEP)
+    hazards = random_hazards(rng, 12)
+    for start, goal in zip(*[iter(random_cells(rng, grid, 10))] * 2):
+        cost = cell_costs(grid, hazards, 500.0, keep=(start, goal))
+        best = dijkstra_costs(grid, cost.data, start)[goal]
+        cells, _, bound = SEARCHES[algo](grid, cost.data, start, goal, max_nodes=10 ** 6)
+        assert cells[0] == start and cells[-1] == goal
+        assert bound == 1.0
+        assert path_cost(grid, cost, cells) == pytest.approx(float(best), rel=1e-4)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_anytime_bound_holds_when_cut_off(seed):
+    rng = np.random.default_rng(seed)
+    grid = get_grid(STEP)
+    hazards = random_hazards(rng, 12)
+    start, goal = random_cells(rng, grid, 2)
+    cost = cell_costs(grid, hazards, 500.0, keep=(start, goal))
+    best = float(dijkstra_costs(grid, cost.data, start)[goal])
+    for max_nodes in (50, 200, 800):
+        cells, _, bound = SEARCHES["anytime"](grid, cost.data, start, goal, max_nodes=max_nodes)
+        if cells is not None:
+            assert path_cost(grid, cost, cells) <= bound * best * (1 + 1e-4)
+
+@pytest.mark.parametrize("seed", range(4))
+def test_dstar_lite_repairs_match_fresh_search(seed):
+    rng = np.random.default_rng(seed)
+    grid = get_grid(STEP)
+    start, goal = random_cells(rng, grid, 2)
+    engine = None
+    for _ in range(4):
+        cost = cell_costs(grid, random_hazards(rng, 12), 500.0, keep=(start, goal))
+        if engine is None:
+            engine = DStarLite(grid, cost, start, goal)
+        else:
+            engine.update_costs(cost)
+        engine.compute(max_nodes=10 ** 6)
+        best = float(dijkstra_costs(grid, cost.data, start)[goal])
+        cells = engine.path()
+        assert cells[0] == start and cells[-1] == goal
+        assert path_cost(grid, cost, cells) == pytest.approx(best, rel=1e-4)
+        assert float(engine.g[start]) == pytest.approx(best, rel=1e-4)
+
+def test_dstar_lite_follows_a_moving_start():
+    rng = np.random.default_rng(7)
+    grid = get_grid(STEP)
+    start, goal = random_cells(rng, grid, 2)
+    cost = cell_costs(grid, random_hazards(rng, 12), 500.0, keep=(start, goal))
+    engine = DStarLite(grid, cost, start, goal)
+    engine.compute(max_nodes=10 ** 6)
+    start = engine.path()[len(engine.path()) // 2]
+    engine.move_to(start)
+    cost = cell_costs(grid, random_hazards(rng, 12), 500.0, keep=(start, goal))
+    engine.update_costs(cost)
+    engine.compute(max_nodes=10 ** 6)
+    best = float(dijkstra_costs(grid, cost.data, start)[goal])
+    assert path_cost(grid, cost, engine.path()) == pytest.approx(best, rel=1e-4)
+
+def drawn_penetration_nm(coords, hazards) -> float:
+    """Deepest point inside any hazard of the route drawn as straight lon/lat segments."""
+    c = np.asarray(coords)
+    t = np.linspace(0.0, 1.0, 50)[None, :]
+    dlon = (c[1:, 0] - c[:-1, 0] + 180.0) % 360.0 - 180.0
+    lon = (c[:-1, 0, None] + dlon[:, None] * t).ravel()
+    lat = (c[:-1, 1, None] + (c[1:, 1] - c[:-1, 1])[:, None] * t).ravel()
+    return max(h.radius_nm - float(haversine_km_np(lat, lon, h.lat, h.lon).min()) * KM_TO_NM for h in hazards)
+
+@pytest.mark.parametrize("seed", range(6))
+def test_any_angle_geometry_stays_clear_when_drawn(seed):
+    rng = np.random.default_rng(seed)
+    o = Waypoint(lat=float(rng.uniform(35, 50)), lon=float(rng.uniform(-60, -40)))
+    d = Waypoint(lat=float(rng.uniform(35, 50)), lon=o.lon + float(rng.uniform(50, 80)))
+    hazards = [HazardCircle(lat=(o.lat + d.lat) / 2 + float(rng.uniform(-3, 3)), lon=(o.lon + d.lon) / 2,
+                            radius_nm=float(rng.uniform(200, 400)))]
+    coords, *_ = a_star_route(o, d, step=0.5, hazards=hazards, penalty_nm=1e6, any_angle=True)
+    assert drawn_penetration_nm(coords, hazards) < 30.0  # one cell: blocking is by cell centre
+
+@pytest.mark.parametrize("count", [3, VISIBILITY_MAX_HAZARDS + 1])
+def test_visibility_route_avoids_hazards_or_falls_back(count):
+    rng = np.random.default_rng(count)
+    o, d = Waypoint(lat=-20.0, lon=-40.0), Waypoint(lat=40.0, lon=60.0)
+    hazards = [HazardCircle(lat=float(rng.uniform(-10, 30)), lon=float(rng.uniform(-20, 40)),
+                            radius_nm=float(rng.uniform(50, 150))) for _ in range(count)]
+    coords, _, _, routed, _, search = a_star_route(o, d, step=0.5, hazards=hazards, algo="visibility")
+    assert routed
+    if count > VISIBILITY_MAX_HAZARDS:
+        assert search == "astar"
+    else:
+        assert search == "visibility"
+        assert drawn_penetration_nm(coords, hazards) < 1.0